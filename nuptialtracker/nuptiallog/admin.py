@@ -25,11 +25,12 @@ from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
+from django.utils import timezone
 from knox.admin import AuthTokenAdmin as BaseAuthTokenAdmin
 from knox.models import AuthToken
 
 from .models import (Changelog, Comment, Device, Flight, FlightImage, FlightUser,
-                     ScientificAdvisor)
+                     ScientificAdvisor, WeatherJob)
 
 
 # Register your models here.
@@ -61,7 +62,7 @@ class FlightLogAdmin(admin.ModelAdmin):
     
     inlines = (CommentInline, FlightImageInline, FlightHistoryInline)
     list_display=('flightID', 'genus', 'species', 'latitude', 'longitude', 'dateOfFlight')
-    list_filter = ['dateOfFlight', 'dateRecorded']
+    list_filter = ['status', 'dateOfFlight', 'dateRecorded']
     search_fields = ['latitude', 'longitude']
     #ordering = ['genus','species','location']
     ordering = ['flightID']
@@ -113,6 +114,7 @@ class UserAdmin(BaseUserAdmin):
         for user in queryset:
             user.flightuser.professional = False
             user.flightuser.save()
+            user.flightuser.refresh_flight_status()
 
 
     def email_professional_user(self, request, queryset):
@@ -140,6 +142,13 @@ class UserAdmin(BaseUserAdmin):
                 # Switch account to citizen scientist
                 user.flightuser.professional = False
                 user.flightuser.save()
+                user.flightuser.refresh_flight_status()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+
+        # The inline may have changed the professional or flagged status
+        form.instance.flightuser.refresh_flight_status()
 
     actions = [flag_user, unflag_user, email_professional_user, mark_user_as_citizen_scientist]
 
@@ -175,3 +184,17 @@ class ScientificAdvisorAdmin(admin.ModelAdmin):
     list_display = ['name', 'position', 'url']
 
 admin.site.register(ScientificAdvisor, ScientificAdvisorAdmin)
+
+class WeatherJobAdmin(admin.ModelAdmin):
+    model = WeatherJob
+
+    list_display = ['flight', 'status', 'attempts', 'run_after', 'updated']
+    list_filter = ['status']
+    readonly_fields = ['created', 'updated']
+
+    def retry_jobs(self, request, queryset):
+        queryset.update(status=WeatherJob.PENDING, attempts=0, run_after=timezone.now(), last_error="")
+
+    actions = [retry_jobs]
+
+admin.site.register(WeatherJob, WeatherJobAdmin)
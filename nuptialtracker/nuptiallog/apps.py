@@ -22,3 +22,8 @@ from django.apps import AppConfig
 
 class NuptiallogConfig(AppConfig):
     name = 'nuptiallog'
+
+    def ready(self):
+        # Imported for its side effect: connecting the signal handlers that
+        # maintain the flight statistics
+        from . import stats  # noqa: F401
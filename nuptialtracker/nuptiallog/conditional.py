@@ -0,0 +1,150 @@
+#
+#  conditional.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Validators for conditional GET requests.
+
+Each function takes the request and the view arguments, as expected by
+Django's `condition` decorator, and computes an ETag or a modification date
+from a few indexed lookups. The serializers are never run for requests that
+end up with a 304 response.
+"""
+
+import hashlib
+from datetime import datetime
+
+from . import snapshots
+from . import tiles
+from .models import DataVersion, Flight, Taxonomy, Weather
+
+def get_format(request):
+    renderer = getattr(request, "accepted_renderer", None)
+    return renderer.format if renderer is not None else "json"
+
+def get_fieldset_tag(request):
+    """
+    Identify the sparse fieldset of a request, since it changes the payload.
+    Anonymous users always get the full list, whatever they ask for.
+    """
+    params = request.GET if request.user.is_authenticated else {}
+    raw = f"{params.get('fields', '*')};{params.get('include', '')}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def flight_list_etag(request, *args, **kwargs):
+    flights_version = DataVersion.current("flights")
+    users_version = DataVersion.current("users")
+    return f'"flights-{flights_version}-{users_version}-{get_fieldset_tag(request)}-{get_format(request)}"'
+
+def get_users_version(request):
+    if not hasattr(request, "_users_version"):
+        request._users_version = DataVersion.current("users")
+
+    return request._users_version
+
+def get_flight_validators(request, pk):
+    """
+    Return the version and owner of a flight, or `None` if it does not exist.
+    """
+    if not hasattr(request, "_flight_validators"):
+        request._flight_validators = Flight.objects.filter(pk=pk).values_list("version", "owner_id").first()
+
+    return request._flight_validators
+
+def flight_etag(request, pk=None, *args, **kwargs):
+    # Only authenticated users may see flight details, so avoid answering
+    # anyone else with a 304 before the permissions are checked.
+    if not request.user.is_authenticated:
+        return None
+
+    flight = get_flight_validators(request, pk)
+
+    if flight is None:
+        return None
+
+    users_version = get_users_version(request)
+    return f'"flight-{pk}-{flight[0]}-{users_version}-{get_fieldset_tag(request)}-{get_format(request)}"'
+
+def statistics_etag(request, dimension="all", *args, **kwargs):
+    flights_version = DataVersion.current("flights")
+    users_version = DataVersion.current("users")
+    return f'"stats-{dimension}-{flights_version}-{users_version}-{get_format(request)}"'
+
+def get_tile_version(request, z, x, y):
+    if not hasattr(request, "_tile_version"):
+        request._tile_version = tiles.get_tile_version(
+            int(z), int(x), int(y), request.query_params, request.user.is_authenticated
+        )
+
+    return request._tile_version
+
+def flight_tile_etag(request, z=None, x=None, y=None, *args, **kwargs):
+    if not tiles.is_valid_tile(int(z), int(x), int(y)):
+        return None
+
+    return f'"tile-{get_tile_version(request, z, x, y)}"'
+
+def get_latest_taxonomy(request):
+    if not hasattr(request, "_latest_taxonomy"):
+        request._latest_taxonomy = Taxonomy.objects.order_by("version").values_list("version", "updated").last()
+
+    return request._latest_taxonomy
+
+def taxonomy_etag(request, *args, **kwargs):
+    taxonomy = get_latest_taxonomy(request)
+
+    if taxonomy is None:
+        return None
+
+    return f'"taxonomy-{taxonomy[0]}-{get_format(request)}"'
+
+def taxonomy_last_modified(request, *args, **kwargs):
+    taxonomy = get_latest_taxonomy(request)
+    return taxonomy[1] if taxonomy is not None else None
+
+def get_weather_validators(request, pk):
+    if not hasattr(request, "_weather_validators"):
+        request._weather_validators = Weather.objects.filter(flight_id=pk).values_list("pk", "timeFetched").first()
+
+    return request._weather_validators
+
+def weather_etag(request, pk=None, *args, **kwargs):
+    weather = get_weather_validators(request, pk)
+
+    if weather is None:
+        return None
+
+    return f'"weather-{weather[0]}-{get_format(request)}"'
+
+def weather_last_modified(request, pk=None, *args, **kwargs):
+    weather = get_weather_validators(request, pk)
+    return weather[1] if weather is not None else None
+
+def get_snapshot(request, file_format):
+    if not hasattr(request, "_snapshot"):
+        request._snapshot = snapshots.get_snapshot(file_format)
+
+    return request._snapshot
+
+def snapshot_etag(request, file_format=None, *args, **kwargs):
+    snapshot = get_snapshot(request, file_format)
+    return snapshot["etag"] if snapshot is not None else None
+
+def snapshot_last_modified(request, file_format=None, *args, **kwargs):
+    snapshot = get_snapshot(request, file_format)
+    return datetime.fromisoformat(snapshot["generated"]) if snapshot is not None else None
@@ -4,3 +4,18 @@ class BadLocationUrlException(exceptions.APIException):
     status_code = 400
     default_detail = {"detail": "Provide a location to use for sorting."}
     default_code = "no_coordinates_location"
+
+class BadDistanceUrlException(exceptions.APIException):
+    status_code = 400
+    default_detail = {"detail": "Provide a location and a positive distance (in km) to filter by distance."}
+    default_code = "bad_distance"
+
+class BadBoundingBoxUrlException(exceptions.APIException):
+    status_code = 400
+    default_detail = {"detail": "Provide a bounding box as minlon,minlat,maxlon,maxlat."}
+    default_code = "bad_bounding_box"
+
+class BadNearestUrlException(exceptions.APIException):
+    status_code = 400
+    default_detail = {"detail": "Provide a location and a positive number of flights to find the nearest flights."}
+    default_code = "bad_nearest"
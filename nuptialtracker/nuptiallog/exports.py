@@ -0,0 +1,184 @@
+#
+#  exports.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Streaming flight data exports.
+
+Rows are built with `FlightSerializerExport`, so they hold the same columns
+and the same flattened weather and `<field>_<i>` comment columns as the pandas
+export. Unlike pandas, which only knows the columns once every row is built,
+the columns are always in the order of `get_columns`, and integers are written
+as integers even in columns with missing values (`1`, where pandas writes
+`1.0`). Flights are read in chunks, each with its own comment prefetch, so
+memory use does not grow with the number of flights. The nested JSON export is
+streamed the same way, as a JSON array or as newline delimited JSON.
+"""
+
+import csv
+
+from django.db.models import Count, Max, Prefetch
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import JSONRenderer
+
+from .models import Comment, Flight
+from .renderers import NDJSONRenderer
+from .serializers import CommentSerializer, FlatWeatherSerializer, FlightSerializerExport
+
+CHUNK_SIZE = 500
+
+EXPORT_RELATIONS = [
+    "species__genus",
+    "owner__flightuser",
+    "validatedBy",
+    "weather",
+]
+
+def get_export_queryset(queryset=None):
+    if queryset is None:
+        queryset = Flight.objects.all()
+
+    return queryset.select_related(*EXPORT_RELATIONS).prefetch_related(
+        Prefetch("comments", queryset=Comment.objects.select_related("author__flightuser"))
+    ).order_by("flightID")
+
+def get_max_comments(queryset):
+    counts = (
+        Comment.objects.filter(responseTo__in=queryset.values("pk"))
+        .values("responseTo")
+        .annotate(count=Count("pk"))
+        .order_by()
+        .aggregate(max_count=Max("count"))
+    )
+
+    return counts["max_count"] or 0
+
+def get_weather_columns():
+    """
+    Return the columns added by `FlatWeatherSerializer`, in the same order.
+    """
+    weather_fields = FlatWeatherSerializer().fields
+    nested = ["description", "weather", "day", "rain", "wind"]
+
+    columns = [name for name in weather_fields if name not in nested]
+
+    for name in nested:
+        columns += [
+            field_name for field_name, field in weather_fields[name].fields.items()
+            if not field.write_only
+        ]
+
+    return columns
+
+def get_comment_columns(max_comments):
+    comment_fields = [name for name in CommentSerializer().fields if name != "flight"]
+    return [f"{name}_{i}" for i in range(max_comments) for name in comment_fields]
+
+def get_columns(max_comments):
+    """
+    Return all the export columns, starting with the flight ID used as the
+    index of the pandas export.
+    """
+    flight_fields = [
+        name for name in FlightSerializerExport().fields
+        if name not in ["weather", "comments"]
+    ]
+
+    return flight_fields + get_weather_columns() + get_comment_columns(max_comments)
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Serialize the flights one chunk at a time.
+    """
+    for flight in queryset.iterator(chunk_size=chunk_size):
+        yield FlightSerializerExport(flight).data
+
+class Echo:
+    """
+    File-like object returning what is written to it, for use with the csv
+    module.
+    """
+
+    def write(self, value):
+        return value
+
+def format_value(value):
+    return "" if value is None else value
+
+def iter_csv(queryset, chunk_size=CHUNK_SIZE):
+    queryset = get_export_queryset(queryset)
+    columns = get_columns(get_max_comments(queryset))
+    writer = csv.writer(Echo())
+
+    yield writer.writerow(columns)
+
+    for row in iter_rows(queryset, chunk_size):
+        yield writer.writerow([format_value(row.get(column)) for column in columns])
+
+def streaming_csv_response(queryset, filename):
+    response = StreamingHttpResponse(iter_csv(queryset), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
+
+def iter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Read the queryset in lists of `chunk_size` objects. Prefetches are run
+    once per chunk.
+    """
+    chunk = []
+
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def iter_serialized(queryset, serializer_class, chunk_size=CHUNK_SIZE, **kwargs):
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield from serializer_class(chunk, many=True, **kwargs).data
+
+def iter_json(items, renderer):
+    """
+    Render the items as a JSON array, with the same output as rendering the
+    whole list at once.
+    """
+    yield b"["
+
+    for i, item in enumerate(items):
+        yield renderer.render(item) if i == 0 else b"," + renderer.render(item)
+
+    yield b"]"
+
+def iter_ndjson(items, renderer):
+    for item in items:
+        yield renderer.render(item) + b"\n"
+
+def streaming_json_response(items, renderer):
+    """
+    Stream the items as JSON, or as newline delimited JSON with an
+    `NDJSONRenderer`.
+    """
+    if isinstance(renderer, NDJSONRenderer):
+        return StreamingHttpResponse(iter_ndjson(items, JSONRenderer()), content_type=renderer.media_type)
+
+    return StreamingHttpResponse(iter_json(items, renderer), content_type=renderer.media_type)
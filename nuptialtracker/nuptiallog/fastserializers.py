@@ -0,0 +1,231 @@
+#
+#  fastserializers.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Read-only fast paths for the flight serializers.
+
+These functions build the same payloads as `SimpleFlightSerializer` and
+`FlightSerializer`, but from `values()` queries into plain dicts, skipping
+the model instances and the per-field work of DRF. Once rendered, their
+output is identical to that of the serializers (see the parity tests). Any
+change to those serializers must be made here too.
+"""
+
+from django.db.models import Max
+from rest_framework import serializers as drf_serializers
+
+from .models import Changelog, Comment, Flight
+from .serializers import FlightSerializer
+
+# Formats dates exactly like the DateTimeFields of the serializers.
+DATE_FIELD = drf_serializers.DateTimeField()
+
+FLIGHT_VALUES = [
+    "flightID",
+    "species_id",
+    "location",
+    "radius",
+    "dateOfFlight",
+    "owner_id",
+    "owner__username",
+    "owner__flightuser__flagged",
+    "owner__flightuser__professional",
+    "dateRecorded",
+    "weather__id",
+    "image",
+    "confidence",
+    "size",
+    "status",
+    "validatedBy_id",
+    "validatedBy__flagged",
+    "validatedBy__user__username",
+    "validatedAt",
+    "image_count",
+    "comment_count",
+]
+
+COMMENT_VALUES = [
+    "id",
+    "responseTo_id",
+    "author__username",
+    "author__flightuser__flagged",
+    "author__flightuser__professional",
+    "text",
+    "time",
+]
+
+def format_date(value):
+    return DATE_FIELD.to_representation(value) if value else None
+
+def get_user_status(flagged, professional):
+    # Same as FlightUser.status. Users without a FlightUser have no status.
+    if flagged is None:
+        return None
+    elif flagged:
+        return -1
+    elif professional:
+        return 1
+    else:
+        return 0
+
+def is_validated(row):
+    # Same as Flight.isValidated
+    if row["status"] == -1:
+        return row["validatedBy_id"] is not None and not row["validatedBy__flagged"]
+
+    return row["status"] == 1
+
+def get_image_url(name, request):
+    if not name:
+        return None
+
+    url = Flight._meta.get_field("image").storage.url(name)
+
+    if request is not None:
+        return request.build_absolute_uri(url)
+
+    return url
+
+def sort_rows(rows, order, get_id):
+    position = {flight_id: index for index, flight_id in enumerate(order)}
+    return sorted(rows, key=lambda row: position[get_id(row)])
+
+def simple_flights(queryset, order=None):
+    """
+    Build the `SimpleFlightSerializer` payloads of the flights. The payloads
+    follow the flight ids in `order` when given, instead of the queryset.
+    """
+    rows = list(queryset.prefetch_related(None).values_list("flightID", "last_updated"))
+
+    if order is not None:
+        rows = sort_rows(rows, order, lambda row: row[0])
+
+    missing = [flight_id for flight_id, last_updated in rows if last_updated is None]
+    fallback = {}
+
+    if missing:
+        fallback = dict(
+            Changelog.objects.filter(flight_id__in=missing)
+            .values("flight_id")
+            .annotate(latest=Max("date"))
+            .values_list("flight_id", "latest")
+        )
+
+    return [
+        {
+            "flightID": flight_id,
+            "lastUpdated": last_updated if last_updated is not None else fallback.get(flight_id),
+        }
+        for flight_id, last_updated in rows
+    ]
+
+def get_comments(flight_ids):
+    comments = {}
+
+    for row in Comment.objects.filter(responseTo__in=flight_ids).values(*COMMENT_VALUES):
+        comments.setdefault(row["responseTo_id"], []).append({
+            "id": row["id"],
+            "flight": row["responseTo_id"],
+            "author": row["author__username"],
+            "role": get_user_status(row["author__flightuser__flagged"], row["author__flightuser__professional"]),
+            "text": row["text"],
+            "time": row["time"],
+        })
+
+    return comments
+
+def get_kept_fields(fields=None, include=None):
+    """
+    Return the names of the fields kept by a sparse fieldset, following
+    `SparseFieldsetMixin`, or `None` if the fast path cannot build it.
+    """
+    names = [name for name, field in FlightSerializer().fields.items() if not field.write_only]
+
+    if fields is None and include is None:
+        return names
+
+    include = include or []
+
+    if set(include) - {"comments"}:
+        return None
+
+    if fields is None:
+        kept = set(names) - set(FlightSerializer.nested_fields)
+    else:
+        if set(fields) - set(names):
+            return None
+
+        kept = set(fields)
+
+    kept |= set(include)
+    return [name for name in names if name in kept]
+
+def supports(fieldset):
+    return get_kept_fields(**fieldset) is not None
+
+def flights(queryset, request=None, fields=None, include=None, order=None):
+    """
+    Build the `FlightSerializer` payloads of the flights, with an optional
+    sparse fieldset. Check `supports` first: included relations other than
+    comments are not handled here. The payloads follow the flight ids in
+    `order` when given, instead of the queryset.
+    """
+    kept = get_kept_fields(fields, include)
+    rows = list(queryset.prefetch_related(None).values(*FLIGHT_VALUES))
+
+    if order is not None:
+        rows = sort_rows(rows, order, lambda row: row["flightID"])
+
+    comments = get_comments([row["flightID"] for row in rows]) if "comments" in kept else {}
+
+    payloads = []
+
+    for row in rows:
+        location = row["location"]
+
+        payload = {
+            "flightID": row["flightID"],
+            "taxonomy": row["species_id"],
+            "latitude": location.y,
+            "longitude": location.x,
+            "radius": row["radius"],
+            "dateOfFlight": format_date(row["dateOfFlight"]),
+            "owner": row["owner__username"],
+            "ownerRole": get_user_status(row["owner__flightuser__flagged"], row["owner__flightuser__professional"]),
+            "dateRecorded": format_date(row["dateRecorded"]),
+            "weather": row["weather__id"] is not None,
+            "comments": comments.get(row["flightID"], []),
+            "image": get_image_url(row["image"], request),
+            "confidence": row["confidence"],
+            "size": row["size"],
+            "validated": is_validated(row),
+            "validatedBy": row["validatedBy__user__username"],
+            "validatedAt": format_date(row["validatedAt"]),
+            "imageCount": row["image_count"],
+            "commentCount": row["comment_count"],
+        }
+
+        if row["owner_id"] is None:
+            # The serializer skips fields whose source cannot be reached
+            del payload["owner"]
+            del payload["ownerRole"]
+
+        payloads.append({name: payload[name] for name in kept if name in payload})
+
+    return payloads
@@ -0,0 +1,90 @@
+#
+#  flightcache.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Cache of serialized flight details.
+
+Entries are keyed by flight id and `Flight.version`, which the signal handlers
+in `models` bump on every write to a flight, its changelog, comments, images
+or weather. A write therefore invalidates the cached payloads of the flight
+without deleting anything: the old entries are never read again and expire.
+The users data version is part of the key, since payloads include user roles.
+
+The `flights` cache alias is used if it is configured, falling back to the
+default cache otherwise.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+CACHE_ALIAS = "flights"
+
+HITS_COUNTER = "flight_cache.hits"
+MISSES_COUNTER = "flight_cache.misses"
+
+def get_cache():
+    if CACHE_ALIAS in settings.CACHES:
+        return caches[CACHE_ALIAS]
+
+    return caches["default"]
+
+def get_variant(request, fieldset):
+    """
+    Identify the other inputs of the payload: the requested fields and the
+    host used to build absolute image URLs.
+    """
+    raw = f"{request.get_host()};{sorted(fieldset.items())}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def get_key(flight_id, version, users_version, variant):
+    return f"flight:{flight_id}:{version}:{users_version}:{variant}"
+
+def get_flight_data(flight_id, version, users_version, variant, build):
+    """
+    Return the cached payload of a flight, calling `build` to serialize it if
+    this version of the flight is not cached.
+    """
+    cache = get_cache()
+    key = get_key(flight_id, version, users_version, variant)
+    data = cache.get(key)
+
+    if data is not None:
+        metrics.increment(HITS_COUNTER)
+        return data
+
+    metrics.increment(MISSES_COUNTER)
+    data = build()
+    cache.set(key, data)
+    return data
+
+def get_statistics():
+    counters = metrics.get_counters([HITS_COUNTER, MISSES_COUNTER])
+    hits = counters[HITS_COUNTER]
+    misses = counters[MISSES_COUNTER]
+    lookups = hits + misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hitRate": hits / lookups if lookups else None,
+    }
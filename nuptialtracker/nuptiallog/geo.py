@@ -0,0 +1,225 @@
+#
+#  geo.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Spatial helpers for filtering flights by location.
+
+All filters start with a bounding box overlap lookup on `Flight.location`,
+which the database answers from the spatial index on that column. Exact
+(and more expensive) distance checks only run on the rows that pass.
+"""
+
+import math
+
+from django.contrib.gis.db.models.functions import Distance, GeoFunc
+from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.measure import D
+from django.db import connections
+from django.db.models import FloatField, Q
+
+from .exceptions import BadBoundingBoxUrlException, BadDistanceUrlException, BadNearestUrlException
+
+# Lower bound of the length of a degree of latitude, and of a degree of
+# longitude at the equator: a degree of latitude is about 110.57 km at the
+# equator on the spheroid and 111.19 km on a sphere. Dividing by it makes
+# bounding boxes at least as large as the circles they contain.
+KM_PER_DEGREE = 110.5
+
+MAX_NEAREST = 500
+
+KNN_RADIUS_MARGIN = 1.01
+
+class KNNDistance(GeoFunc):
+    """
+    PostGIS `<->` operator. Its value is a planar distance in degrees, but
+    ordering by it walks the spatial index, nearest geometries first.
+    """
+    arg_joiner = " <-> "
+    template = "(%(expressions)s)"
+    geom_param_pos = (0, 1)
+    output_field = FloatField()
+
+def parse_location(raw_location):
+    """
+    Parse a `lat,lon` string into a point. Returns `None` if the string is
+    not a valid location.
+    """
+    try:
+        latitude, longitude = (float(value) for value in raw_location.split(","))
+    except (AttributeError, ValueError):
+        return None
+
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+
+    return Point(x=longitude, y=latitude, srid=4326)
+
+def parse_distance(raw_distance):
+    try:
+        distance = float(raw_distance)
+    except (TypeError, ValueError):
+        raise BadDistanceUrlException
+
+    if not distance > 0 or math.isinf(distance):
+        raise BadDistanceUrlException
+
+    return distance
+
+def parse_nearest(raw_nearest):
+    try:
+        nearest = int(raw_nearest)
+    except (TypeError, ValueError):
+        raise BadNearestUrlException
+
+    if nearest < 1:
+        raise BadNearestUrlException
+
+    return min(nearest, MAX_NEAREST)
+
+def parse_bounding_box(raw_bounding_box):
+    """
+    Parse a `minlon,minlat,maxlon,maxlat` string. A box whose minimum
+    longitude is greater than its maximum longitude crosses the antimeridian.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in raw_bounding_box.split(","))
+    except (AttributeError, ValueError):
+        raise BadBoundingBoxUrlException
+
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise BadBoundingBoxUrlException
+
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise BadBoundingBoxUrlException
+
+    return min_lon, min_lat, max_lon, max_lat
+
+def bounding_box_polygons(min_lon, min_lat, max_lon, max_lat):
+    """
+    Return the polygons covering a bounding box, splitting it in two if it
+    crosses the antimeridian.
+    """
+    if min_lon <= max_lon:
+        boxes = [(min_lon, min_lat, max_lon, max_lat)]
+    else:
+        boxes = [(min_lon, min_lat, 180, max_lat), (-180, min_lat, max_lon, max_lat)]
+
+    polygons = []
+
+    for box in boxes:
+        polygon = Polygon.from_bbox(box)
+        polygon.srid = 4326
+        polygons.append(polygon)
+
+    return polygons
+
+def filter_bounding_box(queryset, min_lon, min_lat, max_lon, max_lat):
+    condition = Q()
+
+    for polygon in bounding_box_polygons(min_lon, min_lat, max_lon, max_lat):
+        condition |= Q(location__bboverlaps=polygon)
+
+    return queryset.filter(condition)
+
+def radius_bounding_box(point, distance_km):
+    """
+    Return a bounding box containing every point within `distance_km` of
+    `point`, or `None` if the circle covers a pole or wraps around the globe.
+    """
+    latitude_delta = distance_km / KM_PER_DEGREE
+    min_lat = point.y - latitude_delta
+    max_lat = point.y + latitude_delta
+
+    if min_lat <= -90 or max_lat >= 90:
+        return None
+
+    # Widen using the latitude furthest from the equator, where degrees of
+    # longitude are shortest.
+    widest_latitude = max(abs(min_lat), abs(max_lat))
+    longitude_delta = distance_km / (KM_PER_DEGREE * math.cos(math.radians(widest_latitude)))
+
+    if longitude_delta >= 180:
+        return None
+
+    min_lon = point.x - longitude_delta
+    max_lon = point.x + longitude_delta
+
+    if min_lon < -180:
+        min_lon += 360
+
+    if max_lon > 180:
+        max_lon -= 360
+
+    return min_lon, min_lat, max_lon, max_lat
+
+def filter_within(queryset, point, distance_km):
+    box = radius_bounding_box(point, distance_km)
+
+    if box is not None:
+        queryset = filter_bounding_box(queryset, *box)
+
+    return queryset.filter(location__distance_lte=(point, D(km=distance_km)))
+
+def tile_bounds(zoom, x, y):
+    """
+    Return the `(minlon, minlat, maxlon, maxlat)` bounds of a web mercator
+    (XYZ) map tile.
+    """
+    tiles = 2 ** zoom
+
+    def tile_latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / tiles))))
+
+    min_lon = x / tiles * 360 - 180
+    max_lon = (x + 1) / tiles * 360 - 180
+
+    return min_lon, tile_latitude(y + 1), max_lon, tile_latitude(y)
+
+def supports_knn(queryset):
+    return getattr(connections[queryset.db].ops, "postgis", False)
+
+def nearest_flights(queryset, point, count):
+    """
+    Return the `count` flights closest to `point`, nearest first (then by
+    id), each with its exact (spheroid) distance in the `distance` attribute.
+
+    On PostGIS, the index-assisted KNN operator picks `count` candidates,
+    whose exact distances are the only ones computed. The furthest of them
+    bounds the search radius, so the exact nearest flights are then found
+    with an indexed radius query. Other backends sort the flights by their
+    exact distance.
+    """
+    queryset = queryset.filter(location__isnull=False).order_by()
+    distance = Distance("location", point, spheroid=True)
+
+    if not supports_knn(queryset):
+        return list(queryset.annotate(distance=distance).order_by("distance", "flightID")[:count])
+
+    candidates = list(
+        queryset.annotate(knn=KNNDistance("location", point), distance=distance)
+        .order_by("knn")
+        .values_list("distance", flat=True)[:count]
+    )
+
+    # Radius filters may use a spherical model of the Earth, so leave some
+    # margin to keep the furthest candidate in.
+    if len(candidates) == count:
+        queryset = filter_within(queryset, point, max(candidates).km * KNN_RADIUS_MARGIN)
+
+    return list(queryset.annotate(distance=distance).order_by("distance", "flightID")[:count])
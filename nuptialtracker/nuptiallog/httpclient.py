@@ -0,0 +1,211 @@
+#
+#  httpclient.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Shared HTTP client for calls to other services (OpenWeatherMap, AntWiki).
+
+Each host gets its own session, so connections are pooled and kept alive
+between calls. Every request has connect and read timeouts, and GET requests
+are retried with backoff on connection errors, rate limiting and server
+errors. A circuit breaker per host stops calling a host after repeated
+failures, failing fast until `BREAKER_RESET` has passed, when a single
+request is let through to test the host again.
+
+The number of requests, errors and the total latency are counted for each
+host in `metrics`.
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+# Seconds to wait for a connection and for each read.
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 15
+
+RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# Connections kept alive for each host.
+POOL_SIZE = 10
+
+# Consecutive failures opening the circuit, and seconds before retrying.
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 60
+
+# Hosts always listed in the statistics, even before the first call.
+KNOWN_HOSTS = ["api.openweathermap.org", "www.antwiki.org"]
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised instead of calling a host whose circuit is open.
+    """
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+
+            if state == "closed":
+                return True
+
+            # Let a single trial request through once the reset time has passed
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+sessions = {}
+breakers = {}
+lock = threading.Lock()
+
+def create_session():
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_host(url):
+    return urlsplit(url).hostname or ""
+
+def get_session(host):
+    with lock:
+        if host not in sessions:
+            sessions[host] = create_session()
+            breakers[host] = CircuitBreaker()
+
+        return sessions[host], breakers[host]
+
+def get_counter_names(host):
+    return {
+        "requests": f"http.{host}.requests",
+        "errors": f"http.{host}.errors",
+        "latency": f"http.{host}.latency_ms",
+    }
+
+def is_failure(response):
+    return response.status_code in RETRY_STATUSES
+
+def get(url, params=None, timeout=None, **kwargs):
+    """
+    Send a GET request through the session of the host. Raises
+    `CircuitOpenError` without sending anything if the host keeps failing.
+    Like `requests.get`, error statuses are returned, not raised.
+    """
+    host = get_host(url)
+    session, breaker = get_session(host)
+    counters = get_counter_names(host)
+
+    if not breaker.allow():
+        metrics.increment(counters["errors"])
+        raise CircuitOpenError(f"Too many failed requests to {host}, not calling it for now")
+
+    metrics.increment(counters["requests"])
+    start = time.monotonic()
+
+    try:
+        response = session.get(url, params=params, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    except requests.RequestException:
+        breaker.record_failure()
+        metrics.increment(counters["errors"])
+        raise
+    finally:
+        metrics.increment(counters["latency"], int((time.monotonic() - start) * 1000))
+
+    if is_failure(response):
+        breaker.record_failure()
+        metrics.increment(counters["errors"])
+    else:
+        breaker.record_success()
+
+    return response
+
+def get_statistics():
+    """
+    Return the request counts, error rate, mean latency and circuit state of
+    each host called so far.
+    """
+    with lock:
+        hosts = sorted(set(KNOWN_HOSTS) | set(breakers))
+        states = {host: breaker.state for host, breaker in breakers.items()}
+
+    statistics = {}
+
+    for host in hosts:
+        names = get_counter_names(host)
+        counters = metrics.get_counters(list(names.values()))
+        requests_count = counters[names["requests"]]
+        errors = counters[names["errors"]]
+
+        statistics[host] = {
+            "requests": requests_count,
+            "errors": errors,
+            "errorRate": errors / requests_count if requests_count else None,
+            "meanLatencyMs": counters[names["latency"]] / requests_count if requests_count else None,
+            "circuit": states.get(host, "closed"),
+        }
+
+    return statistics
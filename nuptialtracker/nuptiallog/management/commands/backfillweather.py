@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from nuptiallog import weather
+from nuptiallog.models import Flight, WeatherJob
+
+class RateLimiter:
+    """
+    Spaces out calls so that there are at most `rate` per second, across all
+    threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(self.next_call, now) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+class Command(BaseCommand):
+    help = 'Fetches the weather of the flights that have none, grouping flights close in space and time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=1.0, help='Maximum number of weather API calls per second')
+        parser.add_argument('--workers', type=int, default=settings.WEATHER_WORKERS, help='Number of groups of flights fetched at once')
+        parser.add_argument('--max-age', type=int, default=None, help='Only fetch the weather of flights from the last MAX_AGE days')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of flights to fetch the weather of')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'weather_backfill.json'), help='File recording the progress, to resume from')
+        parser.add_argument('--retry-failed', action='store_true', help='Try again the flights that failed in earlier runs')
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"fetched": 0, "failed": {}}
+
+    def save_checkpoint(self, path, checkpoint):
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.weather_backfill.')
+
+        with os.fdopen(handle, 'w') as file:
+            json.dump(checkpoint, file)
+
+        os.replace(temp_path, path)
+
+    def get_flights(self, options, checkpoint):
+        flights = (
+            Flight.objects.filter(weather__isnull=True)
+            .exclude(weather_job__status__in=[WeatherJob.PENDING, WeatherJob.RUNNING])
+            .only('flightID', 'latitude', 'longitude', 'dateOfFlight')
+            .order_by('flightID')
+        )
+
+        if options['max_age'] is not None:
+            flights = flights.filter(dateOfFlight__gte=timezone.now() - timezone.timedelta(days=options['max_age']))
+
+        failed = set() if options['retry_failed'] else {int(flight_id) for flight_id in checkpoint['failed']}
+        flights = [flight for flight in flights.iterator() if flight.pk not in failed]
+
+        if options['limit'] is not None:
+            flights = flights[:options['limit']]
+
+        return flights
+
+    def group_flights(self, flights):
+        """
+        Group the flights sharing a weather cache entry, so that each group
+        needs a single API call.
+        """
+        current_time = timezone.now()
+        groups = {}
+
+        for flight in flights:
+            lat, lon, old = weather.get_flight_location(flight, current_time)
+            key = weather.get_cache_key(lat, lon, old, flight.dateOfFlight)
+            groups.setdefault(key, []).append(flight)
+
+        return groups
+
+    def fetch_group(self, key, flights, limiter):
+        results = []
+
+        try:
+            for flight in flights:
+                # Only the first flight of a group calls the API, unless it failed
+                if weather.get_cache().get(key) is None:
+                    limiter.wait()
+
+                try:
+                    with transaction.atomic():
+                        weather.get_weather_for_flight(flight, max_age=None)
+                except Exception as error:
+                    results.append((flight.pk, f"{type(error).__name__}: {error}"))
+                else:
+                    results.append((flight.pk, None))
+        finally:
+            connection.close()
+
+        return results
+
+    def report(self, start, groups_done, fetched, failed):
+        elapsed = time.monotonic() - start
+        rate = (fetched + failed) / elapsed if elapsed else 0
+
+        self.stdout.write(
+            f"{groups_done} groups, {fetched} flights fetched, {failed} failed "
+            f"in {elapsed:.0f}s ({rate:.2f} flights/s)"
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = self.load_checkpoint(options['checkpoint'])
+        flights = self.get_flights(options, checkpoint)
+        groups = self.group_flights(flights)
+
+        self.stdout.write(f"Fetching the weather of {len(flights)} flights in {len(groups)} groups")
+
+        fetched_before = checkpoint['fetched']
+        limiter = RateLimiter(options['rate'])
+        start = last_report = time.monotonic()
+        groups_done = fetched = failed = 0
+
+        executor = ThreadPoolExecutor(max_workers=max(options['workers'], 1))
+
+        try:
+            futures = [
+                executor.submit(self.fetch_group, key, group, limiter)
+                for key, group in groups.items()
+            ]
+
+            for future in as_completed(futures):
+                for flight_id, error in future.result():
+                    if error is None:
+                        fetched += 1
+                        checkpoint['failed'].pop(str(flight_id), None)
+                    else:
+                        failed += 1
+                        checkpoint['failed'][str(flight_id)] = error
+
+                groups_done += 1
+
+                if time.monotonic() - last_report >= 10:
+                    checkpoint['fetched'] = fetched_before + fetched
+                    self.save_checkpoint(options['checkpoint'], checkpoint)
+                    self.report(start, groups_done, fetched, failed)
+                    last_report = time.monotonic()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            checkpoint['fetched'] = fetched_before + fetched
+            self.save_checkpoint(options['checkpoint'], checkpoint)
+
+        self.report(start, groups_done, fetched, failed)
+        self.stdout.write(
+            f"{checkpoint['fetched']} flights fetched in total, "
+            f"{len(checkpoint['failed'])} failed (see {options['checkpoint']})"
+        )
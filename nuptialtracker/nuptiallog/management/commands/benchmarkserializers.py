@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from nuptiallog import fastserializers
+from nuptiallog.models import Flight
+from nuptiallog.serializers import FlightSerializer, SimpleFlightSerializer
+
+class Command(BaseCommand):
+    help = 'Checks that the fast paths of the flight serializers render the same JSON, then compares their speed in rows per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="Number of runs of each serializer (the best one is kept)")
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of flights to serialize")
+
+    def check_parity(self, name, serializer, fast_path):
+        # Timings are only worth reporting if both render the same JSON
+        renderer = JSONRenderer()
+
+        if renderer.render(serializer()) != renderer.render(fast_path()):
+            raise CommandError(f"The fast path of {name} does not render the same JSON as the serializer")
+
+    def measure(self, build, repeat):
+        best = None
+        rows = 0
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(build())
+            elapsed = time.perf_counter() - start
+
+            if best is None or elapsed < best:
+                best = elapsed
+
+        return rows / best if best else 0.0
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        flights = Flight.objects.order_by('flightID')
+
+        if options['limit'] is not None:
+            flight_ids = list(flights.values_list('flightID', flat=True)[:options['limit']])
+            flights = flights.filter(flightID__in=flight_ids)
+
+        benchmarks = [
+            (
+                'SimpleFlightSerializer',
+                lambda: SimpleFlightSerializer(flights.only('flightID', 'last_updated'), many=True).data,
+                lambda: fastserializers.simple_flights(flights),
+            ),
+            (
+                'FlightSerializer',
+                lambda: FlightSerializer(FlightSerializer.optimize_queryset(flights), many=True).data,
+                lambda: fastserializers.flights(flights),
+            ),
+        ]
+
+        self.stdout.write(f"Serializing {flights.count()} flights, best of {repeat} runs")
+
+        for name, serializer, fast_path in benchmarks:
+            self.check_parity(name, serializer, fast_path)
+            before = self.measure(serializer, repeat)
+            after = self.measure(fast_path, repeat)
+            speedup = after / before if before else 0.0
+
+            self.stdout.write(f"{name}: {before:.0f} rows/s, fast path: {after:.0f} rows/s ({speedup:.1f}x)")
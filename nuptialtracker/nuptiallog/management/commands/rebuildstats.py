@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from nuptiallog import stats
+
+class Command(BaseCommand):
+    help = 'Recounts the precomputed flight statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dimensions', nargs='*', help=f"Dimensions to rebuild (default: all of {', '.join(stats.DIMENSIONS)})")
+
+    def handle(self, *args, **options):
+        dimensions = options['dimensions'] or stats.DIMENSIONS
+
+        for dimension in dimensions:
+            if dimension not in stats.DIMENSIONS:
+                raise CommandError(f"Unknown dimension '{dimension}'")
+
+        stats.rebuild(dimensions)
+
+        self.stdout.write(f"Rebuilt statistics for {', '.join(dimensions)}")
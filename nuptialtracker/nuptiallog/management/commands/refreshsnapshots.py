@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from nuptiallog import snapshots
+
+class Command(BaseCommand):
+    help = 'Regenerates the flight data export snapshots if the data has changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate the snapshots even if the data has not changed')
+        parser.add_argument('--interval', type=int, default=None, help='Keep running, checking for changes every INTERVAL seconds')
+
+    def refresh(self, force):
+        start = time.perf_counter()
+        manifest = snapshots.refresh(force=force)
+
+        if manifest is None:
+            self.stdout.write("Snapshots are up to date")
+            return
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Wrote snapshots of {manifest['flights']} flights "
+            f"({manifest['rendered']} serialized) in {elapsed:.1f}s"
+        )
+
+    def handle(self, *args, **options):
+        self.refresh(options['force'])
+
+        if options['interval'] is None:
+            return
+
+        while True:
+            time.sleep(max(options['interval'], 1))
+            self.refresh(False)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from nuptiallog.models import Comment, Flight, FlightImage, touch_flight
+
+class Command(BaseCommand):
+    help = 'Recounts the images and comments of each flight, fixing any drifted counters'
+
+    def handle(self, *args, **options):
+        image_counts = (
+            FlightImage.objects.filter(flight=OuterRef('pk'))
+            .order_by().values('flight').annotate(count=Count('pk')).values('count')
+        )
+        comment_counts = (
+            Comment.objects.filter(responseTo=OuterRef('pk'))
+            .order_by().values('responseTo').annotate(count=Count('pk')).values('count')
+        )
+
+        drifted = (
+            Flight.objects.annotate(
+                actual_image_count=Coalesce(Subquery(image_counts), 0),
+                actual_comment_count=Coalesce(Subquery(comment_counts), 0),
+            )
+            .exclude(Q(image_count=F('actual_image_count')) & Q(comment_count=F('actual_comment_count')))
+            .values_list('flightID', 'actual_image_count', 'actual_comment_count')
+        )
+
+        repaired = 0
+
+        for flight_id, image_count, comment_count in drifted:
+            touch_flight(flight_id, image_count=image_count, comment_count=comment_count)
+            repaired += 1
+
+        self.stdout.write(f"Repaired counters for {repaired} flights")
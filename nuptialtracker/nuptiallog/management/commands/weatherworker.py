@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from nuptiallog import weatherjobs
+
+class Command(BaseCommand):
+    help = 'Runs the queued weather fetches for new flights'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.WEATHER_WORKERS, help='Number of weather fetches to run at once')
+        parser.add_argument('--poll', type=float, default=5, help='Seconds to wait before checking for new jobs when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+
+        while True:
+            requeued = weatherjobs.requeue_stale()
+
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} abandoned jobs")
+
+            statuses = weatherjobs.run_pending(workers)
+
+            if statuses:
+                counts = {status: statuses.count(status) for status in sorted(set(statuses))}
+                self.stdout.write(
+                    f"Ran {len(statuses)} jobs: " + ", ".join(f"{count} {status}" for status, count in counts.items())
+                )
+
+            if options['once']:
+                return
+
+            if not statuses:
+                time.sleep(options['poll'])
@@ -0,0 +1,52 @@
+#
+#  metrics.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Simple counters for operational metrics.
+
+Counters are stored in the default cache, so they are shared between worker
+processes when the cache is, and reset when it is cleared.
+"""
+
+from django.core.cache import cache
+
+COUNTER_PREFIX = "metrics"
+
+# Counters are kept for a month after their last increment.
+COUNTER_TIMEOUT = 30 * 24 * 60 * 60
+
+def get_counter_key(name):
+    return f"{COUNTER_PREFIX}:{name}"
+
+def increment(name, amount=1):
+    key = get_counter_key(name)
+
+    # add() does nothing if the counter exists, and incr() is atomic on cache
+    # backends that support it.
+    cache.add(key, 0, COUNTER_TIMEOUT)
+
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # The counter expired between the two calls
+        cache.set(key, amount, COUNTER_TIMEOUT)
+
+def get_counters(names):
+    values = cache.get_many([get_counter_key(name) for name in names])
+    return {name: values.get(get_counter_key(name), 0) for name in names}
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_last_updated(apps, schema_editor):
+    Flight = apps.get_model('nuptiallog', 'Flight')
+    Changelog = apps.get_model('nuptiallog', 'Changelog')
+
+    latest_change = Changelog.objects.filter(flight=OuterRef('pk')).order_by('-date').values('date')[:1]
+    Flight.objects.update(last_updated=Coalesce(Subquery(latest_change), F('dateRecorded')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0020_auto_20240920_2036'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='last_updated',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='date last updated'),
+        ),
+        migrations.RunPython(backfill_last_updated, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0021_flight_last_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flightID', models.IntegerField(db_index=True)),
+                ('deleted_at', models.DateTimeField(db_index=True, verbose_name='date deleted')),
+            ],
+        ),
+    ]
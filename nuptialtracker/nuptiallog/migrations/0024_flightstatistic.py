@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:02
+
+import math
+from collections import Counter
+
+from django.db import migrations, models
+
+# Copy of the keys of nuptiallog.stats when this migration was written, so
+# that later changes to the statistics do not change the migration.
+FLIGHT_FIELDS = [
+    'genus_id',
+    'species_id',
+    'dateOfFlight',
+    'latitude',
+    'longitude',
+    'owner__flightuser__flagged',
+    'owner__flightuser__professional',
+    'validatedBy_id',
+    'validatedBy__flagged',
+]
+
+
+def get_status(row):
+    if row['owner__flightuser__flagged']:
+        return -1
+
+    if row['owner__flightuser__professional']:
+        return 1
+
+    if row['validatedBy_id'] is not None and not row['validatedBy__flagged']:
+        return 1
+
+    return 0
+
+
+def get_keys(row):
+    date = row['dateOfFlight']
+
+    return {
+        'genus': str(row['genus_id']),
+        'species': str(row['species_id']),
+        'month': str(date.month),
+        'day': str(date.timetuple().tm_yday),
+        'status': str(get_status(row)),
+        'region': f"{math.floor(row['latitude'] / 10) * 10},{math.floor(row['longitude'] / 10) * 10}",
+    }
+
+
+def count_flights(apps, schema_editor):
+    Flight = apps.get_model('nuptiallog', 'Flight')
+    FlightStatistic = apps.get_model('nuptiallog', 'FlightStatistic')
+
+    counts = Counter()
+
+    for row in Flight.objects.values(*FLIGHT_FIELDS).order_by().iterator():
+        for dimension, key in get_keys(row).items():
+            counts[(dimension, key)] += 1
+
+    FlightStatistic.objects.bulk_create(
+        FlightStatistic(dimension=dimension, key=key, count=count)
+        for (dimension, key), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0023_dataversion_flight_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=16)),
+                ('key', models.CharField(max_length=32)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('dimension', 'key')},
+            },
+        ),
+        migrations.RunPython(count_flights, migrations.RunPython.noop),
+    ]
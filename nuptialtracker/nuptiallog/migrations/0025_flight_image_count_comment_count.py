@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_relations(apps, schema_editor):
+    Flight = apps.get_model('nuptiallog', 'Flight')
+    FlightImage = apps.get_model('nuptiallog', 'FlightImage')
+    Comment = apps.get_model('nuptiallog', 'Comment')
+
+    image_counts = (
+        FlightImage.objects.filter(flight=OuterRef('pk'))
+        .order_by().values('flight').annotate(count=Count('pk')).values('count')
+    )
+    comment_counts = (
+        Comment.objects.filter(responseTo=OuterRef('pk'))
+        .order_by().values('responseTo').annotate(count=Count('pk')).values('count')
+    )
+
+    Flight.objects.update(
+        image_count=Coalesce(Subquery(image_counts), 0),
+        comment_count=Coalesce(Subquery(comment_counts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0024_flightstatistic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_relations, migrations.RunPython.noop),
+    ]
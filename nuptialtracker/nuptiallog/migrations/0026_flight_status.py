@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:15
+
+import math
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Case, Exists, OuterRef, Value, When
+
+
+# Copy of the keys of nuptiallog.stats when this migration was written, so
+# that later changes to the statistics do not change the migration.
+FLIGHT_FIELDS = ['genus_id', 'species_id', 'dateOfFlight', 'latitude', 'longitude', 'status']
+
+
+def get_keys(row):
+    date = row['dateOfFlight']
+
+    return {
+        'genus': str(row['genus_id']),
+        'species': str(row['species_id']),
+        'month': str(date.month),
+        'day': str(date.timetuple().tm_yday),
+        'status': str(row['status']),
+        'region': f"{math.floor(row['latitude'] / 10) * 10},{math.floor(row['longitude'] / 10) * 10}",
+    }
+
+
+def compute_status(apps, schema_editor):
+    Flight = apps.get_model('nuptiallog', 'Flight')
+    FlightUser = apps.get_model('nuptiallog', 'FlightUser')
+
+    owner = FlightUser.objects.filter(user_id=OuterRef('owner_id'))
+    validator = FlightUser.objects.filter(pk=OuterRef('validatedBy_id'), flagged=False)
+
+    Flight.objects.update(status=Case(
+        When(Exists(owner.filter(flagged=True)), then=Value(-1)),
+        When(Exists(owner.filter(professional=True)), then=Value(1)),
+        When(Exists(validator), then=Value(1)),
+        default=Value(0),
+    ))
+
+
+def count_flights(apps, schema_editor):
+    Flight = apps.get_model('nuptiallog', 'Flight')
+    FlightStatistic = apps.get_model('nuptiallog', 'FlightStatistic')
+
+    counts = Counter()
+
+    for row in Flight.objects.values(*FLIGHT_FIELDS).order_by().iterator():
+        for dimension, key in get_keys(row).items():
+            counts[(dimension, key)] += 1
+
+    FlightStatistic.objects.all().delete()
+    FlightStatistic.objects.bulk_create(
+        FlightStatistic(dimension=dimension, key=key, count=count)
+        for (dimension, key), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0025_flight_image_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='status',
+            field=models.IntegerField(choices=[(-1, 'Flagged'), (0, 'Unverified'), (1, 'Verified')], db_index=True, default=0, verbose_name='verification status'),
+        ),
+        migrations.RunPython(compute_status, migrations.RunPython.noop),
+        migrations.RunPython(count_flights, migrations.RunPython.noop),
+    ]
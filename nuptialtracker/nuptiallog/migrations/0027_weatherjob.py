@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0026_flight_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('skipped', 'Skipped'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='next attempt')),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='weather_job', to='nuptiallog.flight')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='weatherjob_status_run_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0027_weatherjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weather',
+            name='clouds',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='desc',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='description'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='has_rain',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='has_wind',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='humidity',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='longDesc',
+            field=models.CharField(blank=True, default='', max_length=128, verbose_name='full description'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='pressure',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='pressureGround',
+            field=models.FloatField(default=0, null=True, verbose_name='ground pressure'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='pressureSea',
+            field=models.FloatField(default=0, null=True, verbose_name='sea level pressure'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='rain1',
+            field=models.FloatField(default=0, null=True, verbose_name='rain 1 hour'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='rain3',
+            field=models.FloatField(default=0, null=True, verbose_name='rain 3 hour'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='sunrise',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='sunset',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='tempMax',
+            field=models.FloatField(default=0, null=True, verbose_name='max temp'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='tempMin',
+            field=models.FloatField(default=0, null=True, verbose_name='min temp'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='temperature',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='windDegree',
+            field=models.IntegerField(default=0, null=True, verbose_name='direction'),
+        ),
+        migrations.AddField(
+            model_name='weather',
+            name='windSpeed',
+            field=models.FloatField(default=0, null=True, verbose_name='speed'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:07
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+FLAT_FIELDS = {
+    'description': ['desc', 'longDesc'],
+    'weather': ['temperature', 'pressure', 'pressureSea', 'pressureGround', 'humidity', 'tempMin', 'tempMax', 'clouds'],
+    'day': ['sunrise', 'sunset'],
+    'rain': ['rain1', 'rain3'],
+    'wind': ['windSpeed', 'windDegree'],
+}
+
+RELATED_MODELS = {
+    'description': 'WeatherDescription',
+    'weather': 'BasicWeatherData',
+    'day': 'DayInfo',
+    'rain': 'RainInfo',
+    'wind': 'WindInfo',
+}
+
+
+def flatten_weather(apps, schema_editor):
+    Weather = apps.get_model('nuptiallog', 'Weather')
+    field_names = [name for names in FLAT_FIELDS.values() for name in names] + ['has_rain', 'has_wind']
+    batch = []
+
+    for weather in Weather.objects.select_related(*FLAT_FIELDS).order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        for relation, names in FLAT_FIELDS.items():
+            related = getattr(weather, relation)
+
+            if related is None:
+                continue
+
+            for name in names:
+                setattr(weather, name, getattr(related, name))
+
+        weather.has_rain = weather.rain_id is not None
+        weather.has_wind = weather.wind_id is not None
+        batch.append(weather)
+
+        if len(batch) >= BATCH_SIZE:
+            Weather.objects.bulk_update(batch, field_names)
+            batch = []
+
+    if batch:
+        Weather.objects.bulk_update(batch, field_names)
+
+
+def unflatten_weather(apps, schema_editor):
+    Weather = apps.get_model('nuptiallog', 'Weather')
+    models_by_relation = {
+        relation: apps.get_model('nuptiallog', model_name)
+        for relation, model_name in RELATED_MODELS.items()
+    }
+
+    for weather in Weather.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        for relation, names in FLAT_FIELDS.items():
+            if relation == 'rain' and not weather.has_rain or relation == 'wind' and not weather.has_wind:
+                continue
+
+            related = models_by_relation[relation].objects.create(
+                **{name: getattr(weather, name) for name in names}
+            )
+            setattr(weather, relation, related)
+
+        weather.save(update_fields=list(FLAT_FIELDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0028_weather_flat_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(flatten_weather, unflatten_weather),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0029_flatten_weather'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='weather',
+            name='day',
+        ),
+        migrations.RemoveField(
+            model_name='weather',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='weather',
+            name='rain',
+        ),
+        migrations.RemoveField(
+            model_name='weather',
+            name='weather',
+        ),
+        migrations.RemoveField(
+            model_name='weather',
+            name='wind',
+        ),
+        migrations.DeleteModel(
+            name='BasicWeatherData',
+        ),
+        migrations.DeleteModel(
+            name='DayInfo',
+        ),
+        migrations.DeleteModel(
+            name='RainInfo',
+        ),
+        migrations.DeleteModel(
+            name='WeatherDescription',
+        ),
+        migrations.DeleteModel(
+            name='WindInfo',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_changed_at(apps, schema_editor):
+    Flight = apps.get_model('nuptiallog', 'Flight')
+    Changelog = apps.get_model('nuptiallog', 'Changelog')
+
+    # Start the changes feed watermark at the update date, then bring the
+    # update date back to the latest changelog entry.
+    Flight.objects.update(changed_at=Coalesce(F('last_updated'), F('dateRecorded')))
+
+    latest_change = Changelog.objects.filter(flight=OuterRef('pk')).order_by('-date').values('date')[:1]
+    Flight.objects.update(last_updated=Coalesce(Subquery(latest_change), F('dateRecorded')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nuptiallog', '0030_remove_weather_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='date last changed'),
+        ),
+        migrations.RunPython(backfill_changed_at, migrations.RunPython.noop),
+    ]
@@ -24,7 +24,9 @@ from django.contrib.auth.models import User
 from django.contrib.gis.db import models
 from knox.models import AuthToken
 from random import randint
-from django.db.models import signals
+from django.db.models import Q, signals
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
 from django.utils import timezone
 #from drf_extra_fields import fields
 # Create your models here.
@@ -58,21 +60,71 @@ class Flight(models.Model):
     validatedBy = models.ForeignKey('FlightUser', related_name='validatedFlights', on_delete=models.SET_NULL, blank=True, null=True)
     validatedAt = models.DateTimeField('date of validation', null=True, blank=True)
 
+    STATUS_CHOICES = [
+        (-1, "Flagged"),
+        (0, "Unverified"),
+        (1, "Verified"),
+    ]
+    status = models.IntegerField('verification status', choices=STATUS_CHOICES, default=0, db_index=True)
+
+    last_updated = models.DateTimeField('date last updated', null=True, blank=True, db_index=True)
+    # Time of the latest write to the flight or its comments, images, weather
+    # and status, used as the watermark of the changes feed. Unlike
+    # last_updated, it does not follow the changelog.
+    changed_at = models.DateTimeField('date last changed', null=True, blank=True, db_index=True)
+    version = models.PositiveIntegerField(default=0)
+    image_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    # Columns kept up to date by signal handlers using queryset updates. They are
+    # left out of regular saves so that a stale instance never overwrites them.
+    maintained_fields = ['last_updated', 'changed_at', 'version', 'image_count', 'comment_count']
+
+    def save(self, *args, **kwargs):
+        self.status = self.computeStatus()
+
+        if self._state.adding:
+            if self.last_updated is None:
+                self.last_updated = self.dateRecorded
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.maintained_fields
+            ]
+
+        super().save(*args, **kwargs)
+
+    def computeStatus(self)->int:
+        """
+        Compute the verification status of the flight from its owner and
+        validator. The result is stored in `status` on every save, and
+        recomputed in bulk by `refresh_flight_status` when users change.
+        """
+        owner = self.owner.flightuser if self.owner else None
+
+        if owner and owner.flagged:
+            return -1
+        elif owner and owner.professional:
+            return 1
+        elif self.validatedBy != None and not self.validatedBy.flagged:
+            return 1
+        else:
+            return 0
+
     def isValidated(self):
         """
         Determine if a flight has been validated. Flights are implicitly validated
         if created by a professional. Otherwise, a flight is considered validated
         if a professional has verified it.
         """
-        return (self.owner.flightuser.professional and not self.owner.flightuser.flagged) or (self.validatedBy != None and not self.validatedBy.flagged)
+        if self.status == -1:
+            # Flights by flagged users keep their verification
+            return self.validatedBy != None and not self.validatedBy.flagged
+
+        return self.status == 1
 
     def flightStatus(self)->int:
-        if self.owner.flightuser.flagged:
-            return -1
-        elif self.owner.flightuser.professional or self.isValidated():
-            return 1
-        else:
-            return 0
+        return self.status
     
     def __str__(self):
         return f"{self.genus} {self.species} ({self.flightID})"
@@ -88,6 +140,9 @@ class Flight(models.Model):
         return bool(self.image)
 
     def getLastUpdated(self):
+        if self.last_updated is not None:
+            return self.last_updated
+
         return self.changes.order_by('-date').first().date
 
     def get_confidence_string(self):
@@ -120,20 +175,198 @@ def delete_flight_images(sender, instance, **kwargs):
             filename = image.image.path
             os.remove(filename)
 
+def touch_imaged_flight(sender, instance, created, **kwargs):
+    if created:
+        touch_flight(instance.flight_id, image_count=models.F('image_count') + 1)
+    else:
+        touch_flight(instance.flight_id)
+
+def touch_unimaged_flight(sender, instance, **kwargs):
+    touch_flight(instance.flight_id, image_count=Greatest(models.F('image_count') - 1, 0))
+
+signals.post_save.connect(touch_imaged_flight, sender=FlightImage, weak=False, dispatch_uid='models.touch_imaged_flight')
+signals.post_delete.connect(touch_unimaged_flight, sender=FlightImage, weak=False, dispatch_uid='models.touch_imaged_flight_delete')
+
 signals.pre_delete.connect(delete_flight_images, sender=Flight, weak=False, dispatch_uid='models.delete_flight_images')
 
+class DataVersion(models.Model):
+    """
+    Named counter bumped on every write to a group of tables. Counters are
+    cheap validators for conditional requests: if the counter has not moved,
+    nothing in the group has changed.
+    """
+    name = models.CharField(max_length=32, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    @staticmethod
+    def bump(name):
+        if not DataVersion.objects.filter(name=name).update(value=models.F('value') + 1):
+            DataVersion.objects.get_or_create(name=name)
+            DataVersion.objects.filter(name=name).update(value=models.F('value') + 1)
+
+    @staticmethod
+    def current(name):
+        value = DataVersion.objects.filter(name=name).values_list('value', flat=True).first()
+        return value if value is not None else 0
+
+class FlightStatistic(models.Model):
+    """
+    Number of flights for one key of a statistics dimension (for example, the
+    flights in one genus). Kept up to date by `nuptiallog.stats`.
+    """
+    dimension = models.CharField(max_length=16)
+    key = models.CharField(max_length=32)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('dimension', 'key')]
+
+def flight_status_expression():
+    """
+    SQL expression computing the verification status of a flight, matching
+    `Flight.computeStatus`.
+    """
+    owner = FlightUser.objects.filter(user_id=models.OuterRef('owner_id'))
+    validator = FlightUser.objects.filter(pk=models.OuterRef('validatedBy_id'), flagged=False)
+
+    return models.Case(
+        models.When(models.Exists(owner.filter(flagged=True)), then=models.Value(-1)),
+        models.When(models.Exists(owner.filter(professional=True)), then=models.Value(1)),
+        models.When(models.Exists(validator), then=models.Value(1)),
+        default=models.Value(0),
+        output_field=models.IntegerField(),
+    )
+
+def validated_condition(validated=True):
+    """
+    Condition selecting the validated flights (or, with `validated=False`,
+    the other ones), matching `Flight.isValidated`.
+    """
+    if validated:
+        return Q(status=1) | Q(status=-1, validatedBy__isnull=False, validatedBy__flagged=False)
+
+    return Q(status=0) | (Q(status=-1) & (Q(validatedBy__isnull=True) | Q(validatedBy__flagged=True)))
+
+# Sent with the number of flights moved from each old status to each new
+# status, as `transitions={(old_status, new_status): count}`.
+flight_status_changed = Signal()
+
+def refresh_flight_status(queryset):
+    """
+    Recompute the status of the flights in the queryset, updating only the
+    flights whose status has changed. Returns the number of flights moved
+    from each old status to each new status.
+    """
+    changes = (
+        queryset.annotate(new_status=flight_status_expression())
+        .exclude(status=models.F('new_status'))
+        .values_list('pk', 'status', 'new_status')
+    )
+
+    flights_by_transition = {}
+
+    for flight_id, old_status, new_status in changes:
+        flights_by_transition.setdefault((old_status, new_status), []).append(flight_id)
+
+    changed_at = timezone.now()
+    transitions = {}
+
+    for (old_status, new_status), flight_ids in flights_by_transition.items():
+        # Only count the flights still in their old status when updated
+        updated = Flight.objects.filter(pk__in=flight_ids, status=old_status).update(
+            status=new_status, version=models.F('version') + 1, changed_at=changed_at
+        )
+
+        if updated:
+            transitions[(old_status, new_status)] = updated
+
+    if transitions:
+        DataVersion.bump('flights')
+        flight_status_changed.send(sender=Flight, transitions=transitions)
+
+    return transitions
+
+def advance_last_updated(date):
+    """
+    Expression moving the update date of flights forward to `date`, never back.
+    """
+    return models.Case(
+        models.When(Q(last_updated__isnull=True) | Q(last_updated__lt=date), then=models.Value(date)),
+        default=models.F('last_updated'),
+    )
+
+def touch_flight(flight_id, **updates):
+    """
+    Mark a flight as changed, bumping its version and the global flight
+    counter, and setting its change date to now so that the changes feed
+    reports it. Extra column updates can be passed as keyword arguments.
+    """
+    if flight_id is not None:
+        updates.setdefault('changed_at', timezone.now())
+        Flight.objects.filter(pk=flight_id).update(version=models.F('version') + 1, **updates)
+
+    DataVersion.bump('flights')
+
+def touch_saved_flight(sender, instance, **kwargs):
+    touch_flight(instance.pk)
+
+def touch_deleted_flight(sender, instance, **kwargs):
+    DataVersion.bump('flights')
+
+signals.post_save.connect(touch_saved_flight, sender=Flight, weak=False, dispatch_uid='models.touch_saved_flight')
+signals.post_delete.connect(touch_deleted_flight, sender=Flight, weak=False, dispatch_uid='models.touch_deleted_flight')
+
+class FlightTombstone(models.Model):
+    """
+    Record of a deleted flight, kept so that syncing clients can find out
+    about deletions.
+    """
+    flightID = models.IntegerField(db_index=True)
+    deleted_at = models.DateTimeField('date deleted', db_index=True)
+
+def record_flight_tombstone(sender, instance, **kwargs):
+    FlightTombstone.objects.create(flightID=instance.flightID, deleted_at=timezone.now().replace(microsecond=0))
+
+signals.post_delete.connect(record_flight_tombstone, sender=Flight, weak=False, dispatch_uid='models.record_flight_tombstone')
+
 class Comment(models.Model):
     author = models.ForeignKey('auth.User', on_delete=models.CASCADE)
     text = models.TextField()
     time = models.DateTimeField()
     responseTo = models.ForeignKey('Flight', on_delete=models.CASCADE, related_name="comments")
 
+def touch_commented_flight(sender, instance, created, **kwargs):
+    if created:
+        touch_flight(instance.responseTo_id, comment_count=models.F('comment_count') + 1)
+    else:
+        touch_flight(instance.responseTo_id)
+
+def touch_uncommented_flight(sender, instance, **kwargs):
+    touch_flight(instance.responseTo_id, comment_count=Greatest(models.F('comment_count') - 1, 0))
+
+signals.post_save.connect(touch_commented_flight, sender=Comment, weak=False, dispatch_uid='models.touch_commented_flight')
+signals.post_delete.connect(touch_uncommented_flight, sender=Comment, weak=False, dispatch_uid='models.touch_commented_flight_delete')
+
 class Changelog(models.Model):
     user = models.ForeignKey('auth.User', related_name='changes', on_delete=models.CASCADE)
     flight = models.ForeignKey('Flight', related_name='changes', on_delete=models.CASCADE)
     event = models.TextField()
     date = models.DateTimeField()
 
+def update_flight_last_updated(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    touch_flight(instance.flight_id, last_updated=advance_last_updated(instance.date))
+
+    if Changelog.flight.is_cached(instance):
+        flight = instance.flight
+
+        if flight.last_updated is None or flight.last_updated < instance.date:
+            flight.last_updated = instance.date
+
+signals.post_save.connect(update_flight_last_updated, sender=Changelog, weak=False, dispatch_uid='models.update_flight_last_updated')
+
 class Genus(models.Model):
     name = models.CharField(max_length=32)
 
@@ -178,12 +411,20 @@ class FlightUser(models.Model):
         self.user.is_active = False
         self.user.save()
         self.save()
+        self.refresh_flight_status()
 
     def unflag(self):
         self.flagged = False
         self.user.is_active = True
         self.user.save()
         self.save()
+        self.refresh_flight_status()
+
+    def refresh_flight_status(self):
+        """
+        Recompute the status of the flights recorded or verified by this user.
+        """
+        refresh_flight_status(Flight.objects.filter(Q(owner_id=self.user_id) | Q(validatedBy=self)))
 
     def status(self):
         if self.flagged:
@@ -202,6 +443,25 @@ def create_flightUser(sender, instance, created, **kwargs):
 
 signals.post_save.connect(create_flightUser, sender=User, weak=False, dispatch_uid='models.create_flightUser')
 
+def touch_flight_users(sender, instance, **kwargs):
+    DataVersion.bump('users')
+
+signals.post_save.connect(touch_flight_users, sender=FlightUser, weak=False, dispatch_uid='models.touch_flight_users')
+signals.post_delete.connect(touch_flight_users, sender=FlightUser, weak=False, dispatch_uid='models.touch_flight_users_delete')
+
+def remember_validated_flights(sender, instance, **kwargs):
+    instance._validated_flight_ids = list(instance.validatedFlights.values_list('pk', flat=True))
+
+def refresh_unvalidated_flights(sender, instance, **kwargs):
+    # Deleting a user clears the validator of the flights they verified
+    flight_ids = getattr(instance, '_validated_flight_ids', None)
+
+    if flight_ids:
+        refresh_flight_status(Flight.objects.filter(pk__in=flight_ids))
+
+signals.pre_delete.connect(remember_validated_flights, sender=FlightUser, weak=False, dispatch_uid='models.remember_validated_flights')
+signals.post_delete.connect(refresh_unvalidated_flights, sender=FlightUser, weak=False, dispatch_uid='models.refresh_unvalidated_flights')
+
 class Device(models.Model):
     deviceID = models.BigIntegerField('Device ID', default=0, primary_key=True)
     user = models.ForeignKey('auth.User', related_name='devices', on_delete=models.CASCADE, blank=True)
@@ -253,11 +513,19 @@ def logout_device(sender, instance, **kwargs):
 
 signals.pre_delete.connect(logout_device, sender=AuthToken, weak=False, dispatch_uid='models.logout_device')
 
-class WeatherDescription(models.Model):
+class Weather(models.Model):
+    """
+    Weather at the time and place of a flight. The rain and wind are only
+    reported when the weather service gave them, as `has_rain` and `has_wind`
+    tell.
+    """
+    flight = models.OneToOneField('Flight', on_delete=models.SET_NULL, null=True)
+
+    # Description
     desc = models.CharField('description', max_length=64, blank=True, default="")
     longDesc = models.CharField('full description', max_length=128, blank=True, default="")
 
-class BasicWeatherData(models.Model):
+    # Basic weather data
     temperature = models.FloatField(default=0)
     pressure = models.FloatField(default=0)
     pressureSea = models.FloatField('sea level pressure',default=0, null=True)
@@ -267,28 +535,56 @@ class BasicWeatherData(models.Model):
     tempMax = models.FloatField('max temp', default=0, null=True)
     clouds = models.IntegerField(default=0)
 
-class DayInfo(models.Model):
+    # Day
     sunrise = models.DateTimeField(default=timezone.now)
     sunset = models.DateTimeField(default=timezone.now)
 
-class WindInfo(models.Model):
+    # Rain
+    has_rain = models.BooleanField(default=False)
+    rain1 = models.FloatField('rain 1 hour', default=0, null=True)
+    rain3 = models.FloatField('rain 3 hour', default=0, null=True)
+
+    # Wind
+    has_wind = models.BooleanField(default=False)
     windSpeed = models.FloatField('speed', default=0, null=True)
     windDegree = models.IntegerField('direction', default=0, null=True)
 
-class RainInfo(models.Model):
-    rain1 = models.FloatField('rain 1 hour', default=0, null=True)
-    rain3 = models.FloatField('rain 3 hour', default=0, null=True)
+    timeFetched = models.DateTimeField(default=timezone.now)
 
-class Weather(models.Model):
-    flight = models.OneToOneField('Flight', on_delete=models.SET_NULL, null=True)
+def touch_flight_weather(sender, instance, **kwargs):
+    touch_flight(instance.flight_id)
+
+signals.post_save.connect(touch_flight_weather, sender=Weather, weak=False, dispatch_uid='models.touch_flight_weather')
+
+class WeatherJob(models.Model):
+    """
+    Pending weather fetch for a flight, run by the `weatherworker` management
+    command (see `nuptiallog.weatherjobs`). There is at most one job per flight.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (SKIPPED, 'Skipped'),
+        (FAILED, 'Failed'),
+    ]
 
-    description = models.OneToOneField('WeatherDescription', on_delete=models.CASCADE, null=True)
-    weather = models.OneToOneField('BasicWeatherData', on_delete=models.CASCADE, null=True)
-    day = models.OneToOneField('DayInfo', on_delete=models.CASCADE, null=True)
-    rain = models.OneToOneField('RainInfo', on_delete=models.CASCADE, blank=True, null=True)
-    wind = models.OneToOneField('WindInfo', on_delete=models.CASCADE, blank=True, null=True)
+    flight = models.OneToOneField('Flight', related_name='weather_job', on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField('next attempt', default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
 
-    timeFetched = models.DateTimeField(default=timezone.now)
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'], name='weatherjob_status_run_idx')]
 
 class ScientificAdvisor(models.Model):
     name = models.CharField(max_length=75)
@@ -15,9 +15,220 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
-# 
+#
+
+import base64
+import json
 
-from rest_framework.pagination import LimitOffsetPagination
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class BiggerPagesPaginator(LimitOffsetPagination):
-    default_limit = 30
\ No newline at end of file
+    default_limit = 30
+
+class FlightKeysetPaginator(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination for flight lists.
+
+    Pagination only happens when the request contains a `cursor` or a
+    `page_size` query parameter. Otherwise, the whole list is returned, as
+    before. Pages are keyed on the ordering column followed by `flightID`,
+    so each page is a single indexed range scan, no matter how deep into
+    the list the client is. Flights with no value in the ordering column
+    come last, whichever the direction.
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    default_page_size = 100
+    max_page_size = 1000
+
+    # Maps the values accepted by the `ordering` parameter to model fields.
+    ordering_keys = {
+        "flightID": "flightID",
+        "dateOfFlight": "dateOfFlight",
+        "dateRecorded": "dateRecorded",
+        "lastUpdated": "last_updated",
+    }
+    default_ordering = "-flightID"
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        raw_page_size = request.query_params.get(self.page_size_query_param)
+
+        if raw_page_size is None:
+            return self.default_page_size
+
+        try:
+            page_size = int(raw_page_size)
+        except ValueError:
+            raise ParseError("Invalid page size.")
+
+        if page_size < 1:
+            raise ParseError("Invalid page size.")
+
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get("ordering") or self.default_ordering
+        descending = ordering.startswith("-")
+        key = ordering.lstrip("-")
+
+        if key not in self.ordering_keys:
+            raise ParseError(f"Cursor pagination is not supported for ordering '{ordering}'.")
+
+        return key, descending
+
+    def encode_cursor(self, ordering, values):
+        raw = json.dumps({"o": ordering, "k": values}, default=str)
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, encoded, ordering):
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode("ascii"))
+            cursor = json.loads(raw)
+            cursor_ordering = cursor["o"]
+            values = cursor["k"]
+        except (ValueError, TypeError, KeyError):
+            raise ParseError("Invalid cursor.")
+
+        if cursor_ordering != ordering or not isinstance(values, list):
+            raise ParseError("Cursor does not match the requested ordering.")
+
+        return values
+
+    def parse_key_value(self, value):
+        if value is None:
+            return None
+
+        parsed = parse_datetime(value)
+
+        if parsed is None:
+            raise ParseError("Invalid cursor.")
+
+        return parsed
+
+    def filter_after(self, queryset, field, descending, values):
+        lookup = "lt" if descending else "gt"
+
+        try:
+            if field == "flightID":
+                return queryset.filter(**{f"flightID__{lookup}": int(values[0])})
+
+            key_value = self.parse_key_value(values[0])
+            flight_id = int(values[1])
+        except (IndexError, ValueError, TypeError):
+            raise ParseError("Invalid cursor.")
+
+        if key_value is None:
+            # Past the last flight with a value, only flights without one remain
+            return queryset.filter(**{f"{field}__isnull": True, f"flightID__{lookup}": flight_id})
+
+        return queryset.filter(
+            Q(**{f"{field}__{lookup}": key_value})
+            | Q(**{field: key_value, f"flightID__{lookup}": flight_id})
+            | Q(**{f"{field}__isnull": True})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        key, descending = self.get_ordering(request)
+        field = self.ordering_keys[key]
+        ordering = f"-{key}" if descending else key
+
+        prefix = "-" if descending else ""
+
+        if field == "flightID":
+            queryset = queryset.order_by(f"{prefix}flightID")
+        else:
+            column = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+            queryset = queryset.order_by(column, f"{prefix}flightID")
+
+        encoded_cursor = request.query_params.get(self.cursor_query_param)
+
+        if encoded_cursor:
+            values = self.decode_cursor(encoded_cursor, ordering)
+            queryset = self.filter_after(queryset, field, descending, values)
+
+        page = list(queryset[:page_size + 1])
+        has_next = len(page) > page_size
+        page = page[:page_size]
+
+        self.next_cursor = None
+
+        if has_next:
+            last = page[-1]
+
+            if field == "flightID":
+                values = [last.flightID]
+            else:
+                key_value = getattr(last, field)
+                values = [key_value.isoformat() if key_value is not None else None, last.flightID]
+
+            self.next_cursor = self.encode_cursor(ordering, values)
+
+        return page
+
+    def paginate_nearest(self, flights, request):
+        """
+        Paginate a list of flights sorted by distance, as returned by
+        `geo.nearest_flights`. The cursor holds the distance (in metres) and
+        the id of the last flight of the page.
+        """
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        encoded_cursor = request.query_params.get(self.cursor_query_param)
+
+        if encoded_cursor:
+            values = self.decode_cursor(encoded_cursor, "distance")
+
+            try:
+                after = (float(values[0]), int(values[1]))
+            except (IndexError, ValueError, TypeError):
+                raise ParseError("Invalid cursor.")
+
+            flights = [flight for flight in flights if (flight.distance.m, flight.flightID) > after]
+
+        page = flights[:page_size]
+        self.next_cursor = None
+
+        if len(flights) > page_size:
+            last = page[-1]
+            self.next_cursor = self.encode_cursor("distance", [last.distance.m, last.flightID])
+
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
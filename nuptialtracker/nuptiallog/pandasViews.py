@@ -17,13 +17,18 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # 
 
+import tempfile
 from rest_pandas import PandasView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BasicAuthentication
 from rest_framework.generics import GenericAPIView
 from .models import Flight
 from .serializers import FlightSerializerExport
+from django.http import FileResponse
 from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from . import exports
+from . import parquet
 
 class FlightDataExport(PandasView):
     queryset = Flight.objects.all()
@@ -34,4 +39,45 @@ class FlightDataExport(PandasView):
     def get_pandas_filename(self, request, format):
         date = timezone.now()
         date_string = date.strftime("%d_%b_%Y_%H%M%S")
-        return f"FlightData_{date_string}"
\ No newline at end of file
+        return f"FlightData_{date_string}"
+
+    def get(self, request, *args, **kwargs):
+        # Stream CSV exports rather than building the whole DataFrame in memory
+        if request.accepted_renderer.format == "csv":
+            return exports.streaming_csv_response(
+                self.filter_queryset(self.get_queryset()),
+                self.get_pandas_filename(request, "csv"),
+            )
+
+        return super().get(request, *args, **kwargs)
+
+class FlightParquetExport(GenericAPIView):
+    """
+    Parquet export of the flights table or, with `table=weather`, of the
+    weather table.
+    """
+    queryset = Flight.objects.all()
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [BasicAuthentication]
+
+    def get(self, request, *args, **kwargs):
+        table = request.query_params.get("table", "flights")
+
+        if table not in parquet.TABLES:
+            raise ParseError(f"Unknown table '{table}', use one of {', '.join(parquet.TABLES)}.")
+
+        date_string = timezone.now().strftime("%d_%b_%Y_%H%M%S")
+        name = "FlightData" if table == "flights" else "WeatherData"
+
+        # Parquet files are only complete once the footer is written, so the
+        # file is built on disk before being sent.
+        file = tempfile.TemporaryFile()
+        parquet.write_table(file, self.filter_queryset(self.get_queryset()), table)
+        file.seek(0)
+
+        return FileResponse(
+            file,
+            as_attachment=True,
+            filename=f"{name}_{date_string}.parquet",
+            content_type=parquet.CONTENT_TYPE,
+        )
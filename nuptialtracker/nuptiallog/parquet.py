@@ -0,0 +1,186 @@
+#
+#  parquet.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Parquet exports of the flight data.
+
+The flights table has the columns of `FlightSerializerExport`, without the
+weather, and typed columns: timestamps, floats, booleans, and dictionary
+encoded (categorical) taxonomy and levels. The weather is written to its own
+table, with one row per flight that has weather, to be joined on `flightID`.
+
+Rows are written in record batches, so only one batch of each table is held
+in memory at a time.
+"""
+
+from . import exports
+
+CONTENT_TYPE = "application/vnd.apache.parquet"
+
+TABLES = ["flights", "weather"]
+
+# Types of the flight columns, by name. Columns not listed are strings.
+FLIGHT_TYPES = {
+    "flightID": "int64",
+    "genus": "category",
+    "species": "category",
+    "confidence_level": "category",
+    "date_of_flight": "timestamp",
+    "latitude": "float64",
+    "longitude": "float64",
+    "flight_size": "category",
+    "reported_by": "category",
+    "user_professional": "bool",
+    "user_flagged": "bool",
+    "date_recorded": "timestamp",
+    "validated": "bool",
+    "validated_by": "category",
+    "validated_at": "timestamp",
+}
+
+# Types of the comment fields, for the `<field>_<i>` comment columns.
+COMMENT_TYPES = {
+    "id": "int64",
+    "author": "category",
+    "role": "int64",
+    "time": "timestamp",
+}
+
+WEATHER_TYPES = {
+    "flightID": "int64",
+    "desc": "category",
+    "temperature": "float64",
+    "pressure": "float64",
+    "pressureSea": "float64",
+    "pressureGround": "float64",
+    "humidity": "int64",
+    "tempMin": "float64",
+    "tempMax": "float64",
+    "clouds": "int64",
+    "sunrise": "timestamp",
+    "sunset": "timestamp",
+    "rain1": "float64",
+    "rain3": "float64",
+    "windSpeed": "float64",
+    "windDegree": "int64",
+    "time_weather_fetched": "timestamp",
+}
+
+def get_arrow_type(pa, type_name):
+    if type_name == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    elif type_name == "timestamp":
+        return pa.timestamp("us")
+    elif type_name == "bool":
+        return pa.bool_()
+    elif type_name == "int64":
+        return pa.int64()
+    elif type_name == "float64":
+        return pa.float64()
+
+    return pa.string()
+
+def get_comment_type(column):
+    field = column.rsplit("_", 1)[0]
+    return COMMENT_TYPES.get(field, "string")
+
+def get_flight_columns(max_comments):
+    weather_columns = set(exports.get_weather_columns())
+    return [column for column in exports.get_columns(max_comments) if column not in weather_columns]
+
+def get_flight_schema(pa, max_comments):
+    comment_columns = set(exports.get_comment_columns(max_comments))
+
+    return pa.schema([
+        (column, get_arrow_type(pa, get_comment_type(column) if column in comment_columns else FLIGHT_TYPES.get(column)))
+        for column in get_flight_columns(max_comments)
+    ])
+
+def get_weather_schema(pa):
+    return pa.schema([
+        (column, get_arrow_type(pa, WEATHER_TYPES.get(column)))
+        for column in ["flightID"] + exports.get_weather_columns()
+    ])
+
+def has_weather(row):
+    return row.get("time_weather_fetched") is not None
+
+def to_array(pa, values, arrow_type):
+    if pa.types.is_dictionary(arrow_type):
+        return pa.array(values, type=pa.string()).dictionary_encode()
+
+    if pa.types.is_string(arrow_type):
+        values = [None if value is None else str(value) for value in values]
+
+    return pa.array(values, type=arrow_type)
+
+def write_batches(file, schema, rows, batch_size=exports.CHUNK_SIZE):
+    """
+    Write the rows, as dicts, to a Parquet file with the given schema,
+    `batch_size` rows at a time.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def write_batch(writer, batch):
+        arrays = [
+            to_array(pa, [row.get(field.name) for row in batch], field.type)
+            for field in schema
+        ]
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    with pq.ParquetWriter(file, schema) as writer:
+        batch = []
+
+        for row in rows:
+            batch.append(row)
+
+            if len(batch) >= batch_size:
+                write_batch(writer, batch)
+                batch = []
+
+        if batch:
+            write_batch(writer, batch)
+
+def write_flights(file, rows, max_comments):
+    """
+    Write the flights table from export rows.
+    """
+    import pyarrow as pa
+
+    write_batches(file, get_flight_schema(pa, max_comments), rows)
+
+def write_weather(file, rows):
+    """
+    Write the weather table from export rows, skipping flights without weather.
+    """
+    import pyarrow as pa
+
+    write_batches(file, get_weather_schema(pa), (row for row in rows if has_weather(row)))
+
+def write_table(file, queryset, table):
+    """
+    Export a table of the flights in the queryset to a Parquet file.
+    """
+    queryset = exports.get_export_queryset(queryset)
+
+    if table == "weather":
+        write_weather(file, exports.iter_rows(queryset.filter(weather__isnull=False)))
+    else:
+        write_flights(file, exports.iter_rows(queryset), exports.get_max_comments(queryset))
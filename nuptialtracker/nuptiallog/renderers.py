@@ -0,0 +1,37 @@
+#
+# renderers.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from rest_framework.renderers import JSONRenderer
+
+class NDJSONRenderer(JSONRenderer):
+    """
+    Newline delimited JSON renderer. Lists are rendered with one item per
+    line, anything else (such as errors) as a single line.
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return super().render(data, accepted_media_type, renderer_context) + b"\n"
+
+        return b"".join(
+            super(NDJSONRenderer, self).render(item, accepted_media_type, renderer_context) + b"\n"
+            for item in data
+        )
@@ -22,9 +22,121 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth import password_validation
 from django.contrib.gis.geos.point import Point
 from django.utils.timezone import datetime
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
 # from drf_extra_fields.fields import Base64ImageField
-from .models import Flight, Comment, FlightImage, FlightUser, Changelog, Taxonomy, Weather, WeatherDescription, BasicWeatherData, DayInfo, WindInfo, RainInfo, Role, Genus, Species
+from .models import Flight, Comment, FlightImage, FlightUser, Changelog, Taxonomy, Weather, Role, Genus, Species
+
+def get_fieldset(query_params):
+    """
+    Read the sparse fieldset parameters of a request. The result can be passed
+    as keyword arguments to serializers using `SparseFieldsetMixin` and to
+    their `optimize_queryset` method.
+    """
+    fieldset = {}
+
+    for param in ['fields', 'include']:
+        raw = query_params.get(param)
+
+        if raw is not None:
+            fieldset[param] = [name.strip() for name in raw.split(",") if name.strip()]
+
+    return fieldset
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin letting clients pick the fields they need. `fields` is a
+    list of fields to keep and `include` a list of nested relations to add.
+    When either is given, the relations in `nested_fields` are only embedded
+    if they are listed in one of them. Otherwise, the serializer is unchanged.
+    """
+    # Relations embedded by default, which become opt-in when a fieldset is given.
+    nested_fields = []
+
+    # Relations read by each field, as select_related paths or Prefetch objects.
+    field_relations = {}
+
+    def __init__(self, *args, fields=None, include=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is None and include is None:
+            return
+
+        include = include or []
+
+        for name in include:
+            field = self.get_include_field(name)
+
+            if field is None:
+                raise ParseError(f"Cannot include '{name}'.")
+
+            self.fields[name] = field
+
+        if fields is None:
+            kept = set(self.fields) - set(self.nested_fields)
+        else:
+            unknown = set(fields) - set(self.fields)
+
+            if unknown:
+                raise ParseError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+
+            kept = set(fields)
+
+        kept |= set(include)
+
+        for name in list(self.fields):
+            if name not in kept:
+                self.fields.pop(name)
+
+    def get_include_field(self, name):
+        """
+        Return a new serializer field for a relation that can be included, or
+        `None` if the relation cannot be included.
+        """
+        if name == 'comments':
+            return CommentSerializer(many=True, read_only=True)
+
+        if name == 'weather':
+            return WeatherSerializer(read_only=True)
+
+        if name == 'images':
+            return FlightImageSerializer(many=True, read_only=True)
+
+        return None
+
+    @classmethod
+    def get_relations(cls, name, included):
+        if included and name == 'weather':
+            return ['weather']
+
+        if included and name == 'images':
+            return [Prefetch('images', queryset=FlightImage.objects.select_related('created_by'))]
+
+        if included and name == 'comments':
+            return [Prefetch('comments', queryset=Comment.objects.select_related('author__flightuser'))]
+
+        return cls.field_relations.get(name, [])
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, include=None):
+        """
+        Join and prefetch only the relations read by the requested fields.
+        """
+        serializer = cls(fields=fields, include=include)
+        included = set(include or []) | set(cls.nested_fields)
+
+        select = []
+        prefetch = []
+
+        for name in serializer.fields:
+            for relation in cls.get_relations(name, name in included):
+                if isinstance(relation, Prefetch):
+                    prefetch.append(relation)
+                else:
+                    select.append(relation)
+
+        return queryset.select_related(*select).prefetch_related(*prefetch)
 
 # Define flight serializer
 class GenusSerializer(serializers.ModelSerializer):
@@ -107,7 +219,7 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = ('id', 'flight', 'author', 'role', 'text', 'time')
 
-class FlightSerializer(serializers.ModelSerializer):
+class FlightSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # taxonomy = SpeciesSerializer(source='species')
     taxonomy = serializers.IntegerField(source='species.id') #NewSpeciesSerializer(source='species')
     comments = CommentSerializer(many=True, read_only=True, required=False)
@@ -124,6 +236,20 @@ class FlightSerializer(serializers.ModelSerializer):
 
     weather = serializers.BooleanField(source='hasWeather', read_only=True)
 
+    imageCount = serializers.ReadOnlyField(source='image_count')
+    commentCount = serializers.ReadOnlyField(source='comment_count')
+
+    nested_fields = ['comments']
+
+    field_relations = {
+        'taxonomy': ['species'],
+        'owner': ['owner'],
+        'ownerRole': ['owner__flightuser'],
+        'validated': ['validatedBy'],
+        'validatedBy': ['validatedBy__user'],
+        'weather': ['weather'],
+    }
+
     def update(self, instance, validated_data):
 
         new_species = Species.objects.get(pk=validated_data["species"]["id"])
@@ -180,7 +306,7 @@ class FlightSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Flight
-        fields = ('flightID', 'taxonomy', 'latitude', 'longitude', 'radius', 'dateOfFlight', 'owner', 'ownerRole', 'dateRecorded', 'weather', 'comments', 'hasImage', 'image', 'confidence', 'size', 'validated', 'validatedBy', 'validatedAt')
+        fields = ('flightID', 'taxonomy', 'latitude', 'longitude', 'radius', 'dateOfFlight', 'owner', 'ownerRole', 'dateRecorded', 'weather', 'comments', 'hasImage', 'image', 'confidence', 'size', 'validated', 'validatedBy', 'validatedAt', 'imageCount', 'commentCount')
         read_only_fields = ('dateRecorded', 'validatedAt')
         extra_kwargs = {
             'dateRecorded': {'required': False},
@@ -194,6 +320,8 @@ class FlightSerializerBarebones(serializers.ModelSerializer):
     validated = serializers.BooleanField(source="isValidated", read_only=True)
     ownerRole = serializers.ReadOnlyField(source='owner.flightuser.status')
     lastUpdated = serializers.ReadOnlyField(source='getLastUpdated')
+    imageCount = serializers.ReadOnlyField(source='image_count')
+    commentCount = serializers.ReadOnlyField(source='comment_count')
     # image = Base64ImageField(required=False, write_only=True)
 
     latitude = serializers.FloatField(source='location.y')
@@ -201,7 +329,7 @@ class FlightSerializerBarebones(serializers.ModelSerializer):
 
     class Meta:
         model = Flight
-        fields = ('flightID', 'taxonomy', 'owner', 'ownerRole', 'latitude', 'longitude', 'radius', 'dateOfFlight', 'image', 'confidence', 'size', 'lastUpdated', 'validated') #, 'dateRecorded',
+        fields = ('flightID', 'taxonomy', 'owner', 'ownerRole', 'latitude', 'longitude', 'radius', 'dateOfFlight', 'image', 'confidence', 'size', 'lastUpdated', 'validated', 'imageCount', 'commentCount') #, 'dateRecorded',
         extra_kwargs = {
             'radius': {'write_only': True},
             # 'dateRecorded': {'write_only':  True},
@@ -219,6 +347,14 @@ class SimpleFlightSerializer(serializers.ModelSerializer):
         model = Flight
         fields = ('flightID', 'lastUpdated')
 
+class NearbyFlightSerializer(SimpleFlightSerializer):
+    # Distance from the reference location, in km
+    distance = serializers.ReadOnlyField(source='distance.km')
+
+    class Meta:
+        model = Flight
+        fields = ('flightID', 'lastUpdated', 'distance')
+
 class FlightImageSerializer(serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
     class Meta:
@@ -296,38 +432,47 @@ class ChangelogSerializer(serializers.ModelSerializer):
         model = Changelog
         fields = ('user','date','event')
 
+# The weather is stored in a single row, but still grouped as before in the
+# payloads. Each group is read from the whole row (source='*').
+
 class WeatherDescriptionSerializer(serializers.ModelSerializer):
     class Meta:
-        model = WeatherDescription
-        exclude = ['id']
+        model = Weather
+        fields = ('desc', 'longDesc')
 
 class BasicWeatherSerializer(serializers.ModelSerializer):
     class Meta:
-        model = BasicWeatherData
-        exclude = ['id']
+        model = Weather
+        fields = ('temperature', 'pressure', 'pressureSea', 'pressureGround', 'humidity', 'tempMin', 'tempMax', 'clouds')
 
 class DayInfoSerializer(serializers.ModelSerializer):
     class Meta:
-        model = DayInfo
-        exclude = ['id']
+        model = Weather
+        fields = ('sunrise', 'sunset')
 
 class WindSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        return super().to_representation(instance) if instance.has_wind else None
+
     class Meta:
-        model = WindInfo
-        exclude = ['id']
+        model = Weather
+        fields = ('windSpeed', 'windDegree')
 
 class RainSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        return super().to_representation(instance) if instance.has_rain else None
+
     class Meta:
-        model = RainInfo
-        exclude = ['id']
+        model = Weather
+        fields = ('rain1', 'rain3')
 
 class WeatherSerializer(serializers.ModelSerializer):
     flightID = serializers.IntegerField(source='flight_id')
-    description = WeatherDescriptionSerializer()
-    weather = BasicWeatherSerializer()
-    day = DayInfoSerializer()
-    rain = RainSerializer()
-    wind = WindSerializer()
+    description = WeatherDescriptionSerializer(source='*')
+    weather = BasicWeatherSerializer(source='*')
+    day = DayInfoSerializer(source='*')
+    rain = RainSerializer(source='*')
+    wind = WindSerializer(source='*')
 
     class Meta:
         model = Weather
@@ -338,15 +483,15 @@ class DayInfoSerializerExport(serializers.ModelSerializer):
     sunset = serializers.ReadOnlyField()
 
     class Meta:
-        model = DayInfo
+        model = Weather
         fields = ('sunrise', 'sunset')
 
 class FlatWeatherSerializer(serializers.ModelSerializer):
-    description = WeatherDescriptionSerializer()
-    weather = BasicWeatherSerializer()
-    day = DayInfoSerializerExport()
-    rain = RainSerializer()
-    wind = WindSerializer()
+    description = WeatherDescriptionSerializer(source='*')
+    weather = BasicWeatherSerializer(source='*')
+    day = DayInfoSerializerExport(source='*')
+    rain = RainSerializer(source='*')
+    wind = WindSerializer(source='*')
     time_weather_fetched = serializers.ReadOnlyField(source="timeFetched")
 
     def to_representation(self, instance):
@@ -459,7 +604,7 @@ class FlightSerializerExport(serializers.ModelSerializer):
         model = Flight
         fields = ('flightID', 'genus', 'species', 'confidence_level', 'date_of_flight', 'latitude', 'longitude', 'flight_size', 'reported_by', 'user_professional', 'user_flagged', 'date_recorded', 'validated', 'validated_by', 'validated_at', 'weather', 'comments', 'image')
 
-class FlightSerializerFull(serializers.ModelSerializer):
+class FlightSerializerFull(SparseFieldsetMixin, serializers.ModelSerializer):
     genus = serializers.CharField(source='species.genus.name')
     species = serializers.CharField(source='species.name')
     comments = CommentSerializer(many=True, read_only=True)
@@ -476,6 +621,18 @@ class FlightSerializerFull(serializers.ModelSerializer):
     latitude = serializers.FloatField(source='location.y')
     longitude = serializers.FloatField(source='location.x')
 
+    nested_fields = ['weather', 'comments']
+
+    field_relations = {
+        'genus': ['species__genus'],
+        'species': ['species'],
+        'reported_by': ['owner'],
+        'user_professional': ['owner__flightuser'],
+        'user_flagged': ['owner__flightuser'],
+        'validated': ['validatedBy'],
+        'validated_by': ['validatedBy'],
+    }
+
     class Meta:
         model = Flight
         fields = ('flightID', 'genus', 'species', 'confidence_level', 'dateOfFlight', 'latitude', 'longitude', 'flight_size', 'reported_by', 'user_professional', 'user_flagged', 'dateRecorded', 'validated', 'validated_by', 'validated_at', 'weather', 'comments', 'image')
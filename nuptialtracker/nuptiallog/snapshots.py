@@ -0,0 +1,482 @@
+#
+#  snapshots.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Precomputed export snapshots.
+
+The full flight data is written to files under `MEDIA_ROOT/exports` in each
+snapshot format (CSV, XLSX, nested JSON, and the Parquet flights and weather
+tables), so that downloads are served from disk instead of being rebuilt on
+every request. Snapshots are refreshed by the `refreshsnapshots` management
+command, which does nothing unless the data has changed.
+
+The serialized rows of each flight are kept in a JSON row cache under
+`SNAPSHOT_CACHE_DIR`, outside the public media files, along with the version
+of the flight, so a refresh only serializes the flights created or
+changed since the last one. The files themselves are then written from the
+cached rows. Every file is written to a temporary file first and moved into
+place, so readers never see a partial snapshot.
+
+Snapshot files are named after the hash of their content and never change
+once written. The manifest is replaced atomically to switch to new files. The
+files of the previous manifest are kept for one more refresh, so downloads
+that started from it can finish or resume. Older files are then deleted.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from nuptialtracker.settings import MEDIA_ROOT
+from rest_framework.renderers import JSONRenderer
+
+from . import exports
+from . import parquet
+from .models import DataVersion, Flight, Taxonomy
+from .serializers import FlightSerializerExport, FlightSerializerFull
+
+SNAPSHOT_DIR = os.path.join(str(MEDIA_ROOT), "exports")
+
+MANIFEST_NAME = "manifest.json"
+ROWS_NAME = "rows.json"
+
+# Bump when the cached rows change shape, to discard older row caches.
+ROWS_FORMAT = 2
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "json": "application/json",
+    "parquet": parquet.CONTENT_TYPE,
+    "weather.parquet": parquet.CONTENT_TYPE,
+}
+
+FORMATS = list(CONTENT_TYPES)
+
+BLOCK_SIZE = 64 * 1024
+
+def get_path(name):
+    return os.path.join(SNAPSHOT_DIR, name)
+
+FILE_PREFIX = "FlightData."
+
+def get_filename(format):
+    return f"{FILE_PREFIX}{format}"
+
+def get_versioned_filename(format, digest):
+    return f"{FILE_PREFIX}{digest[:16]}.{format}"
+
+def write_atomic(name, write, directory=None):
+    """
+    Call `write` with a binary file object, then move the file into place in
+    `directory` (the snapshot directory by default). `name` is either the name
+    of the file or a function giving it from the SHA-1 hash of the content.
+    Returns the name, size and hash of the file.
+    """
+    directory = directory or SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    prefix = name if isinstance(name, str) else "snapshot"
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{prefix}.")
+
+    try:
+        with os.fdopen(handle, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        size, digest = hash_file(temp_path)
+
+        if not isinstance(name, str):
+            name = name(digest)
+
+        os.replace(temp_path, os.path.join(directory, name))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return name, size, digest
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    size = 0
+
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+            digest.update(block)
+            size += len(block)
+
+    return size, digest.hexdigest()
+
+def get_manifest():
+    """
+    Return the description of the current snapshots, or `None` if they have
+    not been generated yet.
+    """
+    try:
+        with open(get_path(MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def get_snapshot(format):
+    manifest = get_manifest()
+
+    if manifest is None:
+        return None
+
+    return manifest["files"].get(format)
+
+def get_validators():
+    latest_taxonomy = Taxonomy.objects.order_by("version").values_list("version", flat=True).last()
+
+    return {
+        "flightsVersion": DataVersion.current("flights"),
+        "usersVersion": DataVersion.current("users"),
+        "taxonomyVersion": latest_taxonomy,
+    }
+
+def is_stale(manifest, validators):
+    if manifest is None:
+        return True
+
+    return any(manifest.get(key) != value for key, value in validators.items()) or (
+        set(manifest["files"]) != set(FORMATS)
+    )
+
+# Row cache
+
+def get_rows_path():
+    return os.path.join(settings.SNAPSHOT_CACHE_DIR, ROWS_NAME)
+
+def encode_value(value):
+    # Export rows hold dates, which JSON has no type for
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+
+    raise TypeError(f"Cannot store {type(value).__name__} in the row cache")
+
+def decode_object(obj):
+    if len(obj) == 1 and "datetime" in obj:
+        return datetime.fromisoformat(obj["datetime"])
+
+    return obj
+
+def load_rows(validators):
+    """
+    Return the cached rows by flight ID. The cache is dropped when users or the
+    taxonomy have changed, since those show up in the rows of every flight.
+    """
+    try:
+        with open(get_rows_path(), "rb") as file:
+            cached = json.load(file, object_hook=decode_object)
+    except (OSError, ValueError):
+        return {}
+
+    if (
+        not isinstance(cached, dict)
+        or cached.get("format") != ROWS_FORMAT
+        or cached.get("usersVersion") != validators["usersVersion"]
+        or cached.get("taxonomyVersion") != validators["taxonomyVersion"]
+    ):
+        return {}
+
+    return {
+        int(flight_id): (version, row, rendered.encode("utf-8"))
+        for flight_id, (version, row, rendered) in cached["rows"].items()
+    }
+
+def save_rows(rows, validators):
+    cached = {
+        "format": ROWS_FORMAT,
+        "usersVersion": validators["usersVersion"],
+        "taxonomyVersion": validators["taxonomyVersion"],
+        "rows": {
+            flight_id: (version, row, rendered.decode("utf-8"))
+            for flight_id, (version, row, rendered) in rows.items()
+        },
+    }
+    write_atomic(
+        ROWS_NAME,
+        lambda file: file.write(json.dumps(cached, default=encode_value).encode("utf-8")),
+        directory=settings.SNAPSHOT_CACHE_DIR,
+    )
+
+def render_rows(flight_ids):
+    """
+    Serialize the given flights, returning for each of them its version, its
+    export row and its rendered nested JSON.
+    """
+    renderer = JSONRenderer()
+    queryset = exports.get_export_queryset(Flight.objects.filter(pk__in=flight_ids))
+    rows = {}
+
+    for flight in queryset:
+        rows[flight.pk] = (
+            flight.version,
+            dict(FlightSerializerExport(flight).data),
+            renderer.render(FlightSerializerFull(flight).data),
+        )
+
+    return rows
+
+def update_rows(rows):
+    """
+    Bring the cached rows up to date, serializing only the new and changed
+    flights. Returns the rows and the number of flights serialized.
+    """
+    versions = dict(Flight.objects.order_by().values_list("flightID", "version"))
+    changed = [
+        flight_id for flight_id, version in versions.items()
+        if flight_id not in rows or rows[flight_id][0] != version
+    ]
+
+    rows = {flight_id: row for flight_id, row in rows.items() if flight_id in versions}
+
+    for start in range(0, len(changed), exports.CHUNK_SIZE):
+        rows.update(render_rows(changed[start:start + exports.CHUNK_SIZE]))
+
+    return rows, len(changed)
+
+# Writers
+
+def get_export_rows(rows):
+    return [rows[flight_id][1] for flight_id in sorted(rows)]
+
+def count_comments(row, comment_field):
+    count = 0
+
+    while f"{comment_field}_{count}" in row:
+        count += 1
+
+    return count
+
+def get_max_comments(export_rows):
+    # Comments are flattened into `<field>_<i>` columns
+    comment_field = exports.get_comment_columns(1)[0][:-len("_0")]
+    return max((count_comments(row, comment_field) for row in export_rows), default=0)
+
+def get_row_columns(export_rows):
+    return exports.get_columns(get_max_comments(export_rows))
+
+def write_csv(file, rows):
+    export_rows = get_export_rows(rows)
+    columns = get_row_columns(export_rows)
+    writer = csv.writer(exports.Echo())
+
+    file.write(writer.writerow(columns).encode("utf-8"))
+
+    for row in export_rows:
+        line = writer.writerow([exports.format_value(row.get(column)) for column in columns])
+        file.write(line.encode("utf-8"))
+
+def write_xlsx(file, rows):
+    from openpyxl import Workbook
+
+    export_rows = get_export_rows(rows)
+    columns = get_row_columns(export_rows)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Flights")
+    sheet.append(columns)
+
+    for row in export_rows:
+        sheet.append([row.get(column) for column in columns])
+
+    workbook.save(file)
+
+def write_json(file, rows):
+    # Same output as the JSONRenderer for the list of flights
+    file.write(b"[")
+
+    for i, flight_id in enumerate(sorted(rows)):
+        if i:
+            file.write(b",")
+
+        file.write(rows[flight_id][2])
+
+    file.write(b"]")
+
+def write_parquet(file, rows):
+    export_rows = get_export_rows(rows)
+    parquet.write_flights(file, export_rows, get_max_comments(export_rows))
+
+def write_weather_parquet(file, rows):
+    parquet.write_weather(file, get_export_rows(rows))
+
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "json": write_json,
+    "parquet": write_parquet,
+    "weather.parquet": write_weather_parquet,
+}
+
+def refresh(force=False):
+    """
+    Regenerate the snapshots if the data has changed since they were written.
+    Returns the new manifest, or `None` if the snapshots were up to date.
+    """
+    validators = get_validators()
+    previous = get_manifest()
+
+    if not force and not is_stale(previous, validators):
+        return None
+
+    rows, rendered = update_rows(load_rows(validators))
+    save_rows(rows, validators)
+
+    generated = timezone.now()
+    files = {}
+
+    for format in FORMATS:
+        name, size, digest = write_atomic(
+            lambda digest: get_versioned_filename(format, digest),
+            lambda file: WRITERS[format](file, rows),
+        )
+        files[format] = {
+            "name": name,
+            "size": size,
+            "etag": f'"{digest}"',
+            "generated": generated.isoformat(),
+        }
+
+    manifest = dict(validators)
+    manifest.update({
+        "generated": generated.isoformat(),
+        "flights": len(rows),
+        "rendered": rendered,
+        "files": files,
+    })
+
+    write_atomic(MANIFEST_NAME, lambda file: file.write(json.dumps(manifest).encode("utf-8")))
+    remove_old_files([manifest, previous])
+    return manifest
+
+def get_file_names(manifest):
+    if manifest is None:
+        return set()
+
+    return {snapshot["name"] for snapshot in manifest["files"].values()}
+
+def remove_old_files(manifests):
+    """
+    Delete the snapshot files that none of the given manifests refer to.
+    """
+    kept = set().union(*(get_file_names(manifest) for manifest in manifests))
+
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.startswith(FILE_PREFIX) and name not in kept:
+            try:
+                os.remove(get_path(name))
+            except FileNotFoundError:
+                pass
+
+# Serving
+
+def parse_range(header, size):
+    """
+    Parse a single `bytes=` range. Returns the first and last byte positions,
+    `None` if the header should be ignored (missing, malformed or multiple
+    ranges), or raises `ValueError` if the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start, sep, end = header[len("bytes="):].strip().partition("-")
+
+    try:
+        first = int(start) if start else None
+        last = int(end) if end else None
+    except ValueError:
+        return None
+
+    if not sep or first is None and last is None:
+        return None
+
+    if first is None:
+        # Suffix range: the last bytes of the file
+        if last == 0:
+            raise ValueError("Empty suffix range")
+
+        return max(size - last, 0), size - 1
+
+    if last is not None and last < first:
+        return None
+
+    if first >= size:
+        raise ValueError("Range starts after the end of the file")
+
+    return first, size - 1 if last is None else min(last, size - 1)
+
+def iter_file(file, length):
+    with file:
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+
+            if not block:
+                break
+
+            length -= len(block)
+            yield block
+
+def snapshot_response(request, file_format, snapshot):
+    """
+    Serve a snapshot file, or the byte range of it asked for in the `Range`
+    header. Returns `None` if the file is missing.
+    """
+    try:
+        file = open(get_path(snapshot["name"]), "rb")
+    except FileNotFoundError:
+        return None
+
+    size = os.fstat(file.fileno()).st_size
+    content_type = CONTENT_TYPES[file_format]
+    byte_range = None
+
+    # Ranges only apply if the client's copy is still the current snapshot
+    if request.headers.get("If-Range", snapshot["etag"]) == snapshot["etag"]:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, as_attachment=True, filename=get_filename(file_format))
+    else:
+        first, last = byte_range
+        file.seek(first)
+
+        response = StreamingHttpResponse(iter_file(file, last - first + 1), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+        response["Content-Length"] = str(last - first + 1)
+        response["Content-Disposition"] = content_disposition_header(True, get_filename(file_format))
+
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,203 @@
+#
+#  stats.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Precomputed flight statistics.
+
+The number of flights is kept for each key of a few dimensions (genus,
+species, month, day of the year, verification status and region). The counts
+are adjusted by signal handlers whenever a flight is created, changed or
+deleted, so reading them never touches the flights table. They can also be
+rebuilt from scratch using the `rebuildstats` management command.
+"""
+
+import math
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, signals
+
+from .models import DataVersion, Flight, FlightStatistic, Genus, Species, flight_status_changed
+
+DIMENSIONS = ["genus", "species", "month", "day", "status", "region"]
+
+# Size of the regions, in degrees of latitude and longitude.
+REGION_SIZE = 10
+
+STATUS_NAMES = {
+    "-1": "flagged",
+    "0": "unverified",
+    "1": "verified",
+}
+
+# Columns needed to compute the keys of a flight.
+FLIGHT_FIELDS = [
+    "genus_id",
+    "species_id",
+    "dateOfFlight",
+    "latitude",
+    "longitude",
+    "status",
+]
+
+def get_region(latitude, longitude):
+    region_latitude = math.floor(latitude / REGION_SIZE) * REGION_SIZE
+    region_longitude = math.floor(longitude / REGION_SIZE) * REGION_SIZE
+    return f"{region_latitude},{region_longitude}"
+
+def get_keys(row):
+    """
+    Return the key of a flight for each dimension.
+    """
+    date = row["dateOfFlight"]
+
+    return {
+        "genus": str(row["genus_id"]),
+        "species": str(row["species_id"]),
+        "month": str(date.month),
+        "day": str(date.timetuple().tm_yday),
+        "status": str(row["status"]),
+        "region": get_region(row["latitude"], row["longitude"]),
+    }
+
+def get_flight_keys(flight_id):
+    row = Flight.objects.filter(pk=flight_id).values(*FLIGHT_FIELDS).first()
+    return get_keys(row) if row is not None else None
+
+def adjust(dimension, key, amount):
+    statistics = FlightStatistic.objects.filter(dimension=dimension, key=key)
+
+    if not statistics.update(count=F("count") + amount):
+        FlightStatistic.objects.get_or_create(dimension=dimension, key=key)
+        statistics.update(count=F("count") + amount)
+
+def apply_changes(old_keys, new_keys):
+    for dimension in DIMENSIONS:
+        old_key = old_keys[dimension] if old_keys else None
+        new_key = new_keys[dimension] if new_keys else None
+
+        if old_key == new_key:
+            continue
+
+        if old_key is not None:
+            adjust(dimension, old_key, -1)
+
+        if new_key is not None:
+            adjust(dimension, new_key, 1)
+
+def count_flights(dimensions):
+    counts = {dimension: Counter() for dimension in dimensions}
+
+    for row in Flight.objects.values(*FLIGHT_FIELDS).order_by().iterator():
+        keys = get_keys(row)
+
+        for dimension in dimensions:
+            counts[dimension][keys[dimension]] += 1
+
+    return counts
+
+def rebuild(dimensions=None):
+    """
+    Recount the flights for the given dimensions (all of them by default).
+    """
+    dimensions = dimensions or DIMENSIONS
+    counts = count_flights(dimensions)
+
+    with transaction.atomic():
+        FlightStatistic.objects.filter(dimension__in=dimensions).delete()
+        FlightStatistic.objects.bulk_create(
+            FlightStatistic(dimension=dimension, key=key, count=count)
+            for dimension in dimensions
+            for key, count in counts[dimension].items()
+        )
+
+    DataVersion.bump("flights")
+
+def get_names(dimension, keys):
+    if dimension == "genus":
+        genera = Genus.objects.filter(pk__in=[key for key in keys if key.isdigit()])
+        return {str(genus.pk): genus.name for genus in genera}
+
+    if dimension == "species":
+        species = Species.objects.filter(pk__in=[key for key in keys if key.isdigit()]).select_related("genus")
+        return {str(entry.pk): str(entry) for entry in species}
+
+    if dimension == "status":
+        return STATUS_NAMES
+
+    return {}
+
+def sort_key(dimension, entry):
+    if dimension in ["month", "day", "status"]:
+        return int(entry["key"])
+
+    return -entry["count"]
+
+def get_statistics(dimension):
+    """
+    Return the counts for a dimension, leaving out empty keys.
+    """
+    rows = list(
+        FlightStatistic.objects.filter(dimension=dimension, count__gt=0).values_list("key", "count")
+    )
+    names = get_names(dimension, [key for key, count in rows])
+
+    entries = []
+
+    for key, count in rows:
+        entry = {"key": key, "count": count}
+
+        if names:
+            entry["name"] = names.get(key)
+
+        entries.append(entry)
+
+    entries.sort(key=lambda entry: sort_key(dimension, entry))
+    return entries
+
+# Signal handlers keeping the counts up to date
+
+def remember_flight_keys(sender, instance, raw=False, **kwargs):
+    instance._statistic_keys = None
+
+    if not raw and instance.pk is not None:
+        instance._statistic_keys = get_flight_keys(instance.pk)
+
+def update_saved_flight_statistics(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    apply_changes(getattr(instance, "_statistic_keys", None), get_flight_keys(instance.pk))
+
+def update_deleted_flight_statistics(sender, instance, **kwargs):
+    apply_changes(getattr(instance, "_statistic_keys", None), None)
+
+signals.pre_save.connect(remember_flight_keys, sender=Flight, weak=False, dispatch_uid='stats.remember_flight_keys')
+signals.pre_delete.connect(remember_flight_keys, sender=Flight, weak=False, dispatch_uid='stats.remember_deleted_flight_keys')
+signals.post_save.connect(update_saved_flight_statistics, sender=Flight, weak=False, dispatch_uid='stats.update_saved_flight_statistics')
+signals.post_delete.connect(update_deleted_flight_statistics, sender=Flight, weak=False, dispatch_uid='stats.update_deleted_flight_statistics')
+
+def update_status_statistics(sender, transitions, **kwargs):
+    # Flight statuses are recomputed in bulk when users are flagged or made
+    # professionals, without saving the flights.
+    for (old_status, new_status), count in transitions.items():
+        adjust("status", str(old_status), -count)
+        adjust("status", str(new_status), count)
+
+flight_status_changed.connect(update_status_statistics, sender=Flight, weak=False, dispatch_uid='stats.update_status_statistics')
@@ -17,10 +17,13 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # 
 
-from .models import Genus, Species
-import requests
+from .models import Genus, Species, Taxonomy
+from . import httpclient
+from collections import namedtuple
+from django.db.models import Q
 import json
 import os
+import threading
 
 def loadGenera(filename):
     file = open(filename, "r")
@@ -94,13 +97,125 @@ SPECIES_FILE = os.getenv("TAXONOMY_FILE")
 GENERA = loadGenera(SPECIES_FILE)
 SPECIES = loadSpecies(SPECIES_FILE)
 
+# Ids of the genera and species with each name, for one taxonomy version.
+TaxonomyNames = namedtuple("TaxonomyNames", ["version", "genera", "species"])
+
+class TaxonomyIndex:
+    """
+    Process-local index from genus and species names to the ids of all the
+    genera and species with those names, whichever taxonomy they are part of.
+    The index is rebuilt whenever a newer taxonomy version is found, so
+    checking it costs a single primary key lookup. Names missing from the
+    index, such as those added since it was built, are looked up in the
+    database.
+    """
+
+    def __init__(self):
+        self.names = None
+        self.lock = threading.Lock()
+
+    def get_latest_version(self):
+        return Taxonomy.objects.order_by("version").values_list("version", flat=True).last()
+
+    def build(self, version):
+        genera = {}
+        species = {}
+
+        for name, genus_id in Genus.objects.values_list("name", "id"):
+            genera.setdefault(name, []).append(genus_id)
+
+        for genus, name, species_id in Species.objects.values_list("genus__name", "name", "id"):
+            species.setdefault((genus, name), []).append(species_id)
+
+        return TaxonomyNames(
+            version,
+            {name: tuple(ids) for name, ids in genera.items()},
+            {name: tuple(ids) for name, ids in species.items()},
+        )
+
+    def get_names(self):
+        version = self.get_latest_version()
+        names = self.names
+
+        if names is not None and names.version == version:
+            return names
+
+        with self.lock:
+            if self.names is None or self.names.version != version:
+                # Swap the whole index at once, so readers never see a mix
+                self.names = self.build(version)
+
+            return self.names
+
+    def clear(self):
+        self.names = None
+
+    def lookup(self, genus_names, species_names):
+        genus_ids = []
+        species_ids = []
+
+        if genus_names:
+            genus_ids = list(Genus.objects.filter(name__in=genus_names).values_list("id", flat=True))
+
+        if species_names:
+            condition = Q()
+
+            for genus, name in species_names:
+                condition |= Q(genus__name=genus, name=name)
+
+            species_ids = list(Species.objects.filter(condition).values_list("id", flat=True))
+
+        return genus_ids, species_ids
+
+    def resolve(self, entries):
+        """
+        Resolve a list of "Genus" and "Genus species" names to a list of genus
+        ids and a list of species ids. Unknown names are ignored.
+        """
+        names = self.get_names()
+
+        genus_ids = []
+        species_ids = []
+        missing_genera = []
+        missing_species = []
+
+        for entry in entries:
+            split = entry.strip().split(" ", maxsplit=1)
+
+            if len(split) == 1:
+                if split[0] in names.genera:
+                    genus_ids.extend(names.genera[split[0]])
+                else:
+                    missing_genera.append(split[0])
+            else:
+                key = (split[0], split[1])
+
+                if key in names.species:
+                    species_ids.extend(names.species[key])
+                else:
+                    missing_species.append(key)
+
+        if missing_genera or missing_species:
+            found_genus_ids, found_species_ids = self.lookup(missing_genera, missing_species)
+            genus_ids.extend(found_genus_ids)
+            species_ids.extend(found_species_ids)
+
+        return genus_ids, species_ids
+
+TAXONOMY_INDEX = TaxonomyIndex()
+
 # UNKNOWN_GENUS = Genus.objects.get(name="Unknown")
 # UNKNOWN_UNKNOWN = Species.objects.get(genus=UNKNOWN_GENUS, name="sp. (Unknown)")
 
+def get_json(url):
+    response = httpclient.get(url)
+    response.raise_for_status()
+    return response.json()
+
 def fetchTaxonomy(output):
     species = ["# Taxonomy from 'antwiki.org' - CC-BY-SA", "# List of species obtained from https://www.antwiki.org/wiki/index.php?title=Category:Extant_species"]
     initialUrl = "https://www.antwiki.org/wiki/api.php?action=query&list=categorymembers&cmtitle=Category:Extant_species&cmlimit=500&format=json"
-    data = requests.get(initialUrl).json()
+    data = get_json(initialUrl)
 
     species_frame = data["query"]["categorymembers"]
 
@@ -112,7 +227,7 @@ def fetchTaxonomy(output):
         try:
             cmcontinue = data["continue"]["cmcontinue"]
             new_url = initialUrl + f"&cmcontinue={cmcontinue}"
-            data = requests.get(new_url).json()
+            data = get_json(new_url)
             species_frame = data["query"]["categorymembers"]
 
             species_names = [s["title"] for s in species_frame]
@@ -15,8 +15,1239 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
-# 
+#
+
+import csv
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
-from django.test import TestCase
+from . import exports
+from . import fastserializers
+from . import flightcache
+from . import httpclient
+from . import parquet
+from . import snapshots
+from . import stats
+from . import weather
+from . import weatherjobs
+from .models import Changelog, Comment, Flight, FlightImage, FlightUser, Genus, Species, Taxonomy, Weather, WeatherJob, refresh_flight_status
+from .serializers import FlatWeatherSerializer, FlightSerializer, FlightSerializerFull, SimpleFlightSerializer, WeatherSerializer
+from .taxonomy import TAXONOMY_INDEX
 
 # Create your tests here.
+class FlightTestMixin:
+    """
+    Creates the user, taxonomy and flights shared by the flight tests.
+    """
+
+    def create_fixtures(self, username):
+        self.user = User.objects.create_user(username=username, password="not-a-real-password")
+        self.create_taxonomy()
+
+    def create_taxonomy(self):
+        self.genus = Genus.objects.create(name="Lasius")
+        self.species = Species.objects.create(name="niger", genus=self.genus)
+
+    def create_flight(self, latitude=45.5, longitude=-73.6, **overrides):
+        """
+        Create a flight of `self.species` by `self.user`, flown and recorded
+        now at the given position. Any other Flight field can be overridden.
+        """
+        now = timezone.now().replace(microsecond=0)
+        fields = {
+            "owner": self.user,
+            "species": self.species,
+            "dateOfFlight": now,
+            **overrides,
+        }
+        fields.setdefault("genus", fields["species"].genus)
+        fields.setdefault("dateRecorded", fields["dateOfFlight"])
+
+        return Flight.objects.create(
+            latitude=latitude,
+            longitude=longitude,
+            location=Point(longitude, latitude, srid=4326),
+            **fields,
+        )
+
+
+class FlightQueryCountTests(FlightTestMixin, TestCase):
+    """
+    Make sure that the flight endpoints run a fixed number of queries, no
+    matter how many flights or comments are involved.
+    """
+
+    def setUp(self):
+        self.create_fixtures("queryCounter")
+        self.commenter = User.objects.create_user(username="commenter", password="not-a-real-password")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        flightcache.get_cache().clear()
+
+    def create_flight(self, comments=0):
+        flight = super().create_flight()
+        now = flight.dateRecorded
+        Changelog.objects.create(user=self.user, flight=flight, event="Flight created.", date=now)
+
+        for i in range(comments):
+            Comment.objects.create(author=self.commenter, text=f"Comment {i}", time=now, responseTo=flight)
+
+        return flight
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_queries_do_not_grow_with_flights(self):
+        self.create_flight()
+
+        with self.assertNumQueries(3):
+            self.client.get("/api/flights/", secure=True)
+
+        for _ in range(5):
+            self.create_flight(comments=2)
+
+        self.assertEqual(self.count_queries("/api/flights/"), 3)
+
+    def test_retrieve_queries_do_not_grow_with_comments(self):
+        flight = self.create_flight(comments=1)
+        busy_flight = self.create_flight(comments=10)
+
+        self.assertEqual(self.count_queries(f"/api/flights/{flight.flightID}/"), 4)
+        self.assertEqual(self.count_queries(f"/api/flights/{busy_flight.flightID}/"), 4)
+
+    def test_history_queries_do_not_grow_with_entries(self):
+        flight = self.create_flight()
+
+        for i in range(5):
+            Changelog.objects.create(user=self.user, flight=flight, event=f"Change {i}", date=timezone.now())
+
+        self.assertEqual(self.count_queries(f"/api/flights/{flight.flightID}/history/"), 2)
+
+    def test_verify_queries(self):
+        flight = self.create_flight()
+
+        self.assertEqual(self.count_queries(f"/api/flights/{flight.flightID}/verify/"), 1)
+
+    def test_retrieve_is_cached_until_the_flight_changes(self):
+        flight = self.create_flight(comments=1)
+        url = f"/api/flights/{flight.flightID}/"
+
+        self.assertEqual(self.count_queries(url), 4)
+        self.assertEqual(self.count_queries(url), 2)
+
+        Comment.objects.create(author=self.commenter, text="New comment", time=timezone.now(), responseTo=flight)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, secure=True)
+
+        self.assertEqual(len(context.captured_queries), 4)
+        self.assertEqual(len(response.data["comments"]), 2)
+
+
+class FlightListTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("lister")
+        self.client = APIClient()
+
+    def create_flight(self, latitude=45.5, longitude=-73.6, **kwargs):
+        flight = super().create_flight(latitude, longitude, **kwargs)
+        Comment.objects.create(author=self.user, text="First!", time=flight.dateRecorded, responseTo=flight)
+
+        return flight
+
+    def get(self, url):
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_anonymous_fieldset_is_ignored(self):
+        flight = self.create_flight()
+
+        data = self.get("/api/flights/?include=comments")
+        self.assertEqual(data, self.get("/api/flights/"))
+        self.assertEqual(list(data[0]), ["flightID", "lastUpdated"])
+
+        self.client.force_authenticate(self.user)
+        data = self.get("/api/flights/?include=comments")
+        self.assertEqual(data[0]["flightID"], flight.flightID)
+        self.assertEqual(len(data[0]["comments"]), 1)
+
+    def get_all_pages(self, url):
+        flight_ids = []
+
+        while url is not None:
+            data = self.get(url)
+            flight_ids.extend(payload["flightID"] for payload in data["results"])
+            url = data["next"]
+
+        return flight_ids
+
+    def test_cursor_pagination(self):
+        flights = [self.create_flight() for _ in range(5)]
+        flight_ids = [flight.flightID for flight in flights]
+
+        self.assertEqual(self.get_all_pages("/api/flights/?page_size=2"), flight_ids[::-1])
+        self.assertEqual(self.get_all_pages("/api/flights/?page_size=2&ordering=flightID"), flight_ids)
+
+        data = self.get("/api/flights/?page_size=5")
+        self.assertIsNone(data["next"])
+
+    def test_cursor_pagination_without_update_dates(self):
+        flights = [self.create_flight() for _ in range(4)]
+        now = timezone.now()
+
+        # The first two flights predate the update dates stored on flights
+        for index, flight in enumerate(flights):
+            last_updated = None if index < 2 else now - timezone.timedelta(hours=index)
+            Flight.objects.filter(pk=flight.pk).update(last_updated=last_updated)
+
+        ids = [flight.flightID for flight in flights]
+
+        self.assertEqual(self.get_all_pages("/api/flights/?page_size=1&ordering=lastUpdated"), [ids[3], ids[2], ids[0], ids[1]])
+        self.assertEqual(self.get_all_pages("/api/flights/?page_size=1&ordering=-lastUpdated"), [ids[2], ids[3], ids[1], ids[0]])
+
+    def test_nearest_pages(self):
+        flights = [self.create_flight(latitude=latitude, longitude=0) for latitude in [3, 1, 2, 4]]
+
+        flight_ids = self.get_all_pages("/api/flights/?loc=0,0&nearest=3&page_size=2")
+        self.assertEqual(flight_ids, [flights[1].flightID, flights[2].flightID, flights[0].flightID])
+
+    def test_nearest_fieldset(self):
+        self.create_flight(latitude=1, longitude=0)
+        self.client.force_authenticate(self.user)
+
+        data = self.get("/api/flights/?loc=0,0&nearest=1&fields=latitude&include=comments")
+        self.assertEqual(list(data[0]), ["latitude", "comments", "distance"])
+        self.assertAlmostEqual(data[0]["distance"], 110.6, delta=0.5)
+
+    def test_within_radius_edge(self):
+        # About 110.6 km north of the reference point, and just too far
+        inside = self.create_flight(latitude=0.995, longitude=0)
+        self.create_flight(latitude=1.01, longitude=0)
+
+        data = self.get("/api/flights/?loc=0,0&within=110.7")
+        self.assertEqual([payload["flightID"] for payload in data], [inside.flightID])
+
+    def test_bounding_box(self):
+        montreal = self.create_flight(latitude=45.5, longitude=-73.6)
+        fiji = self.create_flight(latitude=-17.7, longitude=178.1)
+        samoa = self.create_flight(latitude=-13.8, longitude=-172.1)
+
+        data = self.get("/api/flights/?bbox=-80,40,-70,50")
+        self.assertEqual([payload["flightID"] for payload in data], [montreal.flightID])
+
+        # Boxes crossing the antimeridian
+        data = self.get("/api/flights/?bbox=170,-20,-170,-10")
+        self.assertEqual(sorted(payload["flightID"] for payload in data), [fiji.flightID, samoa.flightID])
+
+        response = self.client.get("/api/flights/?bbox=-80,50,-70,40", secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_without_flight_ids(self):
+        for latitude in [10, 20, 30]:
+            self.create_flight(latitude=latitude)
+
+        self.client.force_authenticate(self.user)
+        data = self.get("/api/flights/?fields=latitude,longitude&page_size=2")
+
+        self.assertEqual(data["results"], [
+            {"latitude": 30, "longitude": -73.6},
+            {"latitude": 20, "longitude": -73.6},
+        ])
+
+
+class FlightTileTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("mapper")
+        self.client = APIClient()
+        cache.clear()
+
+    def get_tile(self, z, x, y, **headers):
+        return self.client.get(f"/api/flights/tiles/{z}/{x}/{y}/", secure=True, **headers)
+
+    def test_clusters(self):
+        self.create_flight(45.5, -73.6)
+        self.create_flight(45.51, -73.61)
+        self.create_flight(48.85, 2.35)
+
+        response = self.get_tile(0, 0, 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["type"], "clusters")
+        self.assertEqual(sorted(feature["count"] for feature in response.data["features"]), [1, 2])
+
+    def test_points(self):
+        flight = self.create_flight(45.5, -73.6)
+        self.create_flight(48.85, 2.35)
+
+        # Tile holding Montreal at zoom level 12
+        self.client.force_authenticate(self.user)
+        response = self.get_tile(12, 1210, 1465)
+        self.assertEqual(response.data["type"], "points")
+        self.assertEqual([feature["flightID"] for feature in response.data["features"]], [flight.flightID])
+        self.assertEqual(response.data["features"][0]["genus"], "Lasius")
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_anonymous_users_get_clusters(self):
+        self.create_flight(45.5, -73.6)
+
+        self.client.force_authenticate(self.user)
+        private = self.get_tile(12, 1210, 1465)
+
+        self.client.force_authenticate(None)
+        response = self.get_tile(12, 1210, 1465)
+        self.assertEqual(response.data, {"type": "clusters", "features": [{"latitude": 45.5, "longitude": -73.6, "count": 1}]})
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("Authorization", response["Vary"])
+
+        # The ETag of the private tile does not match the public one
+        response = self.get_tile(12, 1210, 1465, HTTP_IF_NONE_MATCH=private["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_flights_change_the_tile(self):
+        self.create_flight(45.5, -73.6)
+        response = self.get_tile(0, 0, 0)
+
+        self.create_flight(45.5, -73.6)
+        self.assertEqual(self.get_tile(0, 0, 0, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        self.assertEqual(self.get_tile(0, 0, 0).data["features"][0]["count"], 2)
+
+    def test_invalid_tile(self):
+        self.assertEqual(self.get_tile(1, 2, 0).status_code, 404)
+
+
+class TaxonomyFilterTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="taxonomist", password="not-a-real-password")
+        self.client = APIClient()
+        TAXONOMY_INDEX.clear()
+
+    def get_flight_ids(self, taxonomy):
+        response = self.client.get("/api/flights/", {"taxonomy": taxonomy}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return sorted(payload["flightID"] for payload in response.data)
+
+    def test_filter_by_genus_and_species(self):
+        lasius = Genus.objects.create(name="Lasius")
+        niger = self.create_flight(species=Species.objects.create(name="niger", genus=lasius))
+        flavus = self.create_flight(species=Species.objects.create(name="flavus", genus=lasius))
+        camponotus = self.create_flight(
+            Species.objects.create(name="pennsylvanicus", genus=Genus.objects.create(name="Camponotus"))
+        )
+
+        self.assertEqual(self.get_flight_ids("Lasius niger"), [niger.flightID])
+        self.assertEqual(self.get_flight_ids("Lasius"), [niger.flightID, flavus.flightID])
+        self.assertEqual(self.get_flight_ids("Camponotus,Lasius flavus"), [flavus.flightID, camponotus.flightID])
+        self.assertEqual(self.get_flight_ids("Myrmica,Lasius emarginatus"), [])
+
+    def test_rows_outside_the_latest_taxonomy(self):
+        old_genus = Genus.objects.create(name="Lasius")
+        flight = self.create_flight(species=Species.objects.create(name="niger", genus=old_genus))
+
+        new_genus = Genus.objects.create(name="Lasius")
+        taxonomy = Taxonomy.objects.create(updated=timezone.now())
+        taxonomy.genera.add(new_genus)
+        taxonomy.species.add(Species.objects.create(name="niger", genus=new_genus))
+
+        self.assertEqual(self.get_flight_ids("Lasius"), [flight.flightID])
+        self.assertEqual(self.get_flight_ids("Lasius niger"), [flight.flightID])
+
+    def test_names_added_after_the_index_was_built(self):
+        self.assertEqual(self.get_flight_ids("Lasius niger"), [])
+
+        flight = self.create_flight(species=Species.objects.create(name="niger", genus=Genus.objects.create(name="Lasius")))
+        self.assertEqual(self.get_flight_ids("Lasius niger"), [flight.flightID])
+        self.assertEqual(self.get_flight_ids("Lasius"), [flight.flightID])
+
+
+class FlightLastUpdatedTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("updater")
+        self.recorded = timezone.now().replace(microsecond=0) - timezone.timedelta(days=2)
+        self.flight = self.create_flight(dateOfFlight=self.recorded)
+
+    def get_last_updated(self):
+        return Flight.objects.get(pk=self.flight.pk).last_updated
+
+    def log(self, date):
+        Changelog.objects.create(user=self.user, flight_id=self.flight.pk, event="Flight edited.", date=date)
+
+    def test_starts_at_recording_date(self):
+        self.assertEqual(self.get_last_updated(), self.recorded)
+
+    def test_follows_the_latest_change(self):
+        edited = self.recorded + timezone.timedelta(days=1)
+        self.log(edited)
+        self.assertEqual(self.get_last_updated(), edited)
+
+        # Entries logged late never move the date back
+        self.log(self.recorded - timezone.timedelta(days=1))
+        self.assertEqual(self.get_last_updated(), edited)
+        self.assertEqual(self.flight.getLastUpdated(), self.recorded)
+        self.assertEqual(Flight.objects.get(pk=self.flight.pk).getLastUpdated(), edited)
+
+    def test_stale_instance_keeps_the_date(self):
+        edited = self.recorded + timezone.timedelta(days=1)
+        self.log(edited)
+
+        self.flight.confidence = 1
+        self.flight.save()
+        self.assertEqual(self.get_last_updated(), edited)
+
+
+class FlightBatchTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("batcher")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ids_in_query(self):
+        first = self.create_flight()
+        second = self.create_flight()
+        missing_id = second.flightID + 1
+
+        response = self.client.get(f"/api/flights/batch/?ids={second.flightID},{missing_id},{first.flightID},{second.flightID}", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([payload["flightID"] for payload in response.data["flights"]], [second.flightID, first.flightID])
+        self.assertEqual(response.data["missing"], [missing_id])
+
+    def test_ids_posted(self):
+        flights = [self.create_flight() for _ in range(3)]
+        ids = [flight.flightID for flight in flights]
+
+        response = self.client.post("/api/flights/batch/?fields=flightID", {"ids": ids}, format="json", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["flights"], [{"flightID": flight_id} for flight_id in ids])
+        self.assertEqual(Flight.objects.count(), 3)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get("/api/flights/batch/", secure=True).status_code, 400)
+        self.assertEqual(self.client.get("/api/flights/batch/?ids=1,two", secure=True).status_code, 400)
+
+        ids = list(range(1, 202))
+        response = self.client.post("/api/flights/batch/", {"ids": ids}, format="json", secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_authentication(self):
+        flight = self.create_flight()
+        self.client.force_authenticate(None)
+
+        response = self.client.get(f"/api/flights/batch/?ids={flight.flightID}", secure=True)
+        self.assertEqual(response.status_code, 401)
+
+
+class FlightChangesTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("syncer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_old_flight(self, **kwargs):
+        # Flight recorded and last changed a week ago
+        flight = self.create_flight(**kwargs)
+        week_ago = timezone.now() - timezone.timedelta(days=7)
+        Flight.objects.filter(pk=flight.pk).update(dateRecorded=week_ago, last_updated=week_ago, changed_at=week_ago)
+
+        return flight
+
+    def get_changes(self, since):
+        response = self.client.get(f"/api/flights/changes/?since={int(since.timestamp())}", secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_requires_authentication(self):
+        self.create_flight()
+        self.client.force_authenticate(None)
+
+        response = self.client.get("/api/flights/changes/?since=0", secure=True)
+        self.assertEqual(response.status_code, 401)
+
+    def test_created_flight(self):
+        flight = self.create_flight()
+        data = self.get_changes(timezone.now() - timezone.timedelta(minutes=1))
+
+        self.assertEqual(data["created"], [flight.flightID])
+        self.assertEqual(data["flights"][0]["owner"], self.user.username)
+
+    def assertUpdatedBy(self, flight, write):
+        since = timezone.now() - timezone.timedelta(days=1)
+        self.assertEqual(self.get_changes(since)["updated"], [])
+
+        write()
+        self.assertEqual(self.get_changes(since)["updated"], [flight.flightID])
+
+    def test_new_comment(self):
+        flight = self.create_old_flight()
+        self.assertUpdatedBy(flight, lambda: Comment.objects.create(
+            author=self.user, text="Still flying", time=timezone.now(), responseTo=flight
+        ))
+
+    def test_new_weather(self):
+        flight = self.create_old_flight()
+        self.assertUpdatedBy(flight, lambda: Weather.objects.create(flight=flight))
+
+    def test_status_refresh(self):
+        validator = User.objects.create_user(username="validator", password="not-a-real-password")
+        flight = self.create_old_flight(validatedBy=validator.flightuser, validatedAt=timezone.now())
+
+        self.assertUpdatedBy(flight, validator.flightuser.flag)
+        self.assertEqual(Flight.objects.get(pk=flight.pk).status, 0)
+
+    def test_last_updated_is_left_alone(self):
+        flight = self.create_old_flight()
+        last_updated = Flight.objects.get(pk=flight.pk).last_updated
+
+        Comment.objects.create(author=self.user, text="Still flying", time=timezone.now(), responseTo=flight)
+        Weather.objects.create(flight=flight)
+
+        # Reported by the feed, without a new changelog entry
+        since = timezone.now() - timezone.timedelta(days=1)
+        self.assertEqual(self.get_changes(since)["updated"], [flight.flightID])
+        self.assertEqual(Flight.objects.get(pk=flight.pk).last_updated, last_updated)
+
+
+class FlightCounterTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("tallier")
+        self.flight = self.create_flight()
+
+    def get_counts(self):
+        return Flight.objects.values_list("image_count", "comment_count").get(pk=self.flight.pk)
+
+    def add_comment(self):
+        return Comment.objects.create(author=self.user, text="Wings everywhere", time=timezone.now(), responseTo=self.flight)
+
+    def add_image(self):
+        return FlightImage.objects.create(
+            flight=self.flight, image="flight_pics/flight.jpg", created_by=self.user, date_created=timezone.now()
+        )
+
+    def test_counts_follow_writes(self):
+        comment = self.add_comment()
+        self.add_comment()
+        image = self.add_image()
+        self.assertEqual(self.get_counts(), (1, 2))
+
+        # Edits leave the counts alone
+        comment.text = "Edited"
+        comment.save()
+        self.assertEqual(self.get_counts(), (1, 2))
+
+        comment.delete()
+        image.delete()
+        self.assertEqual(self.get_counts(), (0, 1))
+
+    def test_has_images_filter(self):
+        client = APIClient()
+
+        response = client.get("/api/flights/?has_images=true", secure=True)
+        self.assertEqual(response.data, [])
+
+        self.add_image()
+        response = client.get("/api/flights/?has_images=true", secure=True)
+        self.assertEqual([payload["flightID"] for payload in response.data], [self.flight.flightID])
+
+        response = client.get("/api/flights/?has_images=false", secure=True)
+        self.assertEqual(response.data, [])
+
+    def test_repair_counts(self):
+        self.add_comment()
+        self.add_image()
+        Flight.objects.filter(pk=self.flight.pk).update(image_count=5, comment_count=0)
+
+        output = StringIO()
+        call_command("repaircounts", stdout=output)
+        self.assertEqual(self.get_counts(), (1, 1))
+        self.assertIn("Repaired counters for 1 flights", output.getvalue())
+
+
+class ConditionalGetTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("revalidator")
+        self.flight = self.create_flight()
+        self.client = APIClient()
+
+    def get(self, url, **headers):
+        return self.client.get(url, secure=True, **headers)
+
+    def assertRevalidates(self, url):
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        cached = self.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        return response
+
+    def test_flight_list(self):
+        response = self.assertRevalidates("/api/flights/")
+
+        Comment.objects.create(author=self.user, text="Still flying", time=timezone.now(), responseTo=self.flight)
+        self.assertEqual(self.get("/api/flights/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_flight_list_fieldsets(self):
+        self.client.force_authenticate(self.user)
+        response = self.assertRevalidates("/api/flights/")
+
+        sparse = self.get("/api/flights/?fields=flightID", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(sparse.status_code, 200)
+
+    def test_flight_detail(self):
+        url = f"/api/flights/{self.flight.flightID}/"
+        self.client.force_authenticate(self.user)
+        response = self.assertRevalidates(url)
+
+        # Anonymous users are never told that a flight has not changed
+        self.client.force_authenticate(None)
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 401)
+
+    def test_weather(self):
+        Weather.objects.create(flight=self.flight)
+        url = f"/api/flights/{self.flight.flightID}/weather/"
+        response = self.assertRevalidates(url)
+
+        cached = self.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_taxonomy(self):
+        taxonomy = Taxonomy.objects.create(updated=timezone.now())
+        taxonomy.genera.add(self.genus)
+        taxonomy.species.add(self.species)
+
+        self.assertRevalidates("/api/taxonomy-version/")
+        response = self.assertRevalidates("/api/taxonomy/")
+
+        Taxonomy.objects.create(updated=timezone.now())
+        self.assertEqual(self.get("/api/taxonomy-version/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+
+class FlightStatusTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("recorder")
+        self.validator = User.objects.create_user(username="validator", password="not-a-real-password")
+
+    def get_statuses(self):
+        return list(Flight.objects.order_by("flightID").values_list("status", flat=True))
+
+    def assertStatusesComputed(self):
+        flights = Flight.objects.order_by("flightID")
+        self.assertEqual(self.get_statuses(), [flight.computeStatus() for flight in flights])
+
+    def test_stored_on_save(self):
+        self.create_flight()
+        self.create_flight(validatedBy=self.validator.flightuser, validatedAt=timezone.now())
+        self.assertEqual(self.get_statuses(), [0, 1])
+
+    def test_refresh_transitions(self):
+        self.create_flight()
+        self.create_flight(validatedBy=self.validator.flightuser, validatedAt=timezone.now())
+
+        # Only the flight that was not verified yet changes
+        self.user.flightuser.professional = True
+        self.user.flightuser.save()
+        self.assertEqual(refresh_flight_status(Flight.objects.all()), {(0, 1): 1})
+        self.assertEqual(refresh_flight_status(Flight.objects.all()), {})
+        self.assertStatusesComputed()
+
+    def test_flagged_users(self):
+        self.create_flight()
+        self.create_flight(validatedBy=self.validator.flightuser, validatedAt=timezone.now())
+
+        self.user.flightuser.flag()
+        self.assertEqual(self.get_statuses(), [-1, -1])
+        self.assertStatusesComputed()
+
+        # Flights by flagged users keep their verification
+        self.assertEqual([flight.isValidated() for flight in Flight.objects.order_by("flightID")], [False, True])
+
+        self.user.flightuser.unflag()
+        self.validator.flightuser.flag()
+        self.assertEqual(self.get_statuses(), [0, 0])
+        self.assertStatusesComputed()
+
+    def test_verified_filter_matches_payload(self):
+        unverified = self.create_flight()
+        validated = self.create_flight(validatedBy=self.validator.flightuser, validatedAt=timezone.now())
+        self.user.flightuser.flag()
+
+        # A flagged owner keeps the verification of an unflagged validator
+        client = APIClient()
+        client.force_authenticate(self.validator)
+
+        for verified, flight in [("true", validated), ("false", unverified)]:
+            response = client.get(f"/api/flights/?verified={verified}&fields=flightID,validated", secure=True)
+            self.assertEqual(response.data, [{"flightID": flight.flightID, "validated": verified == "true"}])
+
+        self.validator.flightuser.flag()
+        client.force_authenticate(self.user)
+        response = client.get("/api/flights/?verified=true", secure=True)
+        self.assertEqual(response.data, [])
+
+    def test_deleted_validator(self):
+        self.create_flight(validatedBy=self.validator.flightuser, validatedAt=timezone.now())
+
+        self.validator.delete()
+        self.assertEqual(self.get_statuses(), [0])
+
+
+class FastSerializerParityTests(FlightTestMixin, TestCase):
+    """
+    The fast paths must render exactly the same JSON as the serializers.
+    """
+
+    def setUp(self):
+        self.citizen = User.objects.create_user(username="citizen", password="not-a-real-password")
+        self.professional = User.objects.create_user(username="professional", password="not-a-real-password")
+        self.professional.flightuser.professional = True
+        self.professional.flightuser.save()
+        self.flagged = User.objects.create_user(username="flagged", password="not-a-real-password")
+        self.flagged.flightuser.flag()
+
+        self.create_taxonomy()
+
+        now = timezone.now()
+
+        commented = self.create_flight(self.citizen, now)
+        Comment.objects.create(author=self.professional, text="Nice find", time=now, responseTo=commented)
+        Comment.objects.create(author=self.citizen, text="Thanks!", time=now, responseTo=commented)
+        Weather.objects.create(flight=commented)
+
+        self.create_flight(self.professional, now, image="flight_pics/flight.jpg", confidence=1, size=0)
+        self.create_flight(self.citizen, now, validatedBy=self.professional.flightuser, validatedAt=now)
+        self.create_flight(self.flagged, now.replace(microsecond=0), validatedBy=self.professional.flightuser, validatedAt=now)
+
+        # Flight from before the update date was stored on flights
+        legacy = self.create_flight(self.citizen, now)
+        Flight.objects.filter(pk=legacy.pk).update(last_updated=None)
+
+        # Owner and commenter without a FlightUser, who has no role
+        orphan = User.objects.create_user(username="orphan", password="not-a-real-password")
+        FlightUser.objects.filter(user=orphan).delete()
+        orphaned = self.create_flight(orphan, now)
+        Comment.objects.create(author=orphan, text="Mine", time=now, responseTo=orphaned)
+
+    def create_flight(self, owner, date, **kwargs):
+        flight = super().create_flight(owner=owner, dateOfFlight=date, **kwargs)
+        Changelog.objects.create(user=owner, flight=flight, event="Flight created.", date=date)
+
+        return flight
+
+    def get_flights(self):
+        return Flight.objects.order_by("flightID")
+
+    def assertSameJSON(self, expected, actual):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(expected), renderer.render(actual))
+
+    def test_simple_flights(self):
+        expected = SimpleFlightSerializer(self.get_flights(), many=True).data
+        self.assertSameJSON(expected, fastserializers.simple_flights(self.get_flights()))
+
+    def test_flights(self):
+        expected = FlightSerializer(self.get_flights(), many=True).data
+        self.assertSameJSON(expected, fastserializers.flights(self.get_flights()))
+
+    def test_flights_with_request(self):
+        request = RequestFactory().get("/api/flights/", secure=True)
+        expected = FlightSerializer(self.get_flights(), many=True, context={"request": request}).data
+        self.assertSameJSON(expected, fastserializers.flights(self.get_flights(), request=request))
+
+    def test_sparse_fieldsets(self):
+        fieldsets = [
+            {"fields": ["flightID", "taxonomy", "latitude", "longitude", "validated"]},
+            {"include": ["comments"]},
+            {"fields": ["flightID", "comments"]},
+            {"fields": ["flightID"], "include": ["comments"]},
+        ]
+
+        for fieldset in fieldsets:
+            with self.subTest(fieldset=fieldset):
+                self.assertTrue(fastserializers.supports(fieldset))
+                expected = FlightSerializer(self.get_flights(), many=True, **fieldset).data
+                self.assertSameJSON(expected, fastserializers.flights(self.get_flights(), **fieldset))
+
+
+    def test_streamed_nested_json(self):
+        renderer = JSONRenderer()
+        expected = renderer.render(FlightSerializerFull(self.get_flights(), many=True).data)
+        items = exports.iter_serialized(
+            FlightSerializerFull.optimize_queryset(self.get_flights()), FlightSerializerFull, chunk_size=2
+        )
+        self.assertEqual(expected, b"".join(exports.iter_json(items, renderer)))
+
+class CSVExportTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("downloader")
+
+        for comments in [0, 2, 1]:
+            flight = self.create_flight()
+
+            for i in range(comments):
+                Comment.objects.create(author=self.user, text=f"Comment {i}", time=timezone.now(), responseTo=flight)
+
+        Weather.objects.create(flight=flight, desc="Clear", temperature=24.5, humidity=60, clouds=10)
+
+    def read_csv(self, lines):
+        return list(csv.DictReader("".join(lines).splitlines()))
+
+    def normalize(self, row):
+        # pandas writes integer columns with missing values as floats
+        def normalize_value(value):
+            try:
+                return float(value)
+            except ValueError:
+                return value
+
+        return {column: normalize_value(value) for column, value in row.items()}
+
+    def test_columns(self):
+        rows = self.read_csv(exports.iter_csv(Flight.objects.all()))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(list(rows[0]), exports.get_columns(2))
+        self.assertEqual([row["text_1"] for row in rows], ["", "Comment 1", ""])
+        self.assertEqual({row["genus"] for row in rows}, {"Lasius"})
+
+    def test_pandas_parity(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        # The txt format is still rendered by pandas, as CSV
+        response = client.get("/api/flights/download?format=txt", secure=True)
+        expected = self.read_csv(response.content.decode("utf-8"))
+
+        response = client.get("/api/flights/download?format=csv", secure=True)
+        rows = self.read_csv(b"".join(response.streaming_content).decode("utf-8"))
+
+        self.assertEqual(list(rows[0])[0], list(expected[0])[0])
+        self.assertEqual(sorted(rows[0]), sorted(expected[0]))
+        expected.sort(key=lambda row: int(row["flightID"]))
+        self.assertEqual([self.normalize(row) for row in rows], [self.normalize(row) for row in expected])
+
+    def test_chunks(self):
+        expected = list(exports.iter_csv(Flight.objects.all()))
+        self.assertEqual(list(exports.iter_csv(Flight.objects.all(), chunk_size=1)), expected)
+
+    def test_download(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get("/api/flights/download?format=csv", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(".csv", response["Content-Disposition"])
+
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEqual(len(self.read_csv(content)), 3)
+
+
+class ParquetExportTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("researcher")
+        self.flights = [self.create_flight() for _ in range(3)]
+
+        Comment.objects.create(author=self.user, text="Swarming", time=timezone.now(), responseTo=self.flights[0])
+        Weather.objects.create(flight=self.flights[1], temperature=21.5)
+
+    def read_table(self, table):
+        import pyarrow.parquet as pq
+
+        file = BytesIO()
+        parquet.write_table(file, Flight.objects.all(), table)
+        file.seek(0)
+        return pq.read_table(file)
+
+    def test_flights(self):
+        import pyarrow as pa
+
+        table = self.read_table("flights")
+
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column_names, parquet.get_flight_columns(1))
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("genus").type))
+        self.assertTrue(pa.types.is_timestamp(table.schema.field("date_of_flight").type))
+        self.assertEqual(table.column("flightID").to_pylist(), [flight.flightID for flight in self.flights])
+        self.assertEqual(table.column("text_0").to_pylist(), ["Swarming", None, None])
+
+    def test_weather(self):
+        table = self.read_table("weather")
+
+        self.assertEqual(table.column("flightID").to_pylist(), [self.flights[1].flightID])
+        self.assertEqual(table.column("temperature").to_pylist(), [21.5])
+
+    def test_download(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get("/api/flights/download-parquet?table=weather", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], parquet.CONTENT_TYPE)
+        self.assertIn("WeatherData_", response["Content-Disposition"])
+        self.assertEqual(b"".join(response.streaming_content)[:4], b"PAR1")
+
+        response = client.get("/api/flights/download-parquet?table=rain", secure=True)
+        self.assertEqual(response.status_code, 400)
+
+
+class FlightStatisticsTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("counter")
+        self.validator = User.objects.create_user(username="validator", password="not-a-real-password")
+
+    def get_counts(self, dimension):
+        return {entry["key"]: entry["count"] for entry in stats.get_statistics(dimension)}
+
+    def test_flight_writes_adjust_counts(self):
+        flight = self.create_flight()
+        self.assertEqual(self.get_counts("genus"), {str(self.genus.pk): 1})
+        self.assertEqual(self.get_counts("region"), {"40,-80": 1})
+
+        other_genus = Genus.objects.create(name="Formica")
+        flight.genus = other_genus
+        flight.latitude = 51.5
+        flight.save()
+        self.assertEqual(self.get_counts("genus"), {str(other_genus.pk): 1})
+        self.assertEqual(self.get_counts("region"), {"50,-80": 1})
+
+        flight.delete()
+        self.assertEqual(self.get_counts("genus"), {})
+
+    def test_rebuild(self):
+        self.create_flight()
+        self.create_flight()
+
+        # Queryset updates bypass the signal handlers
+        Flight.objects.update(latitude=-12.5)
+        self.assertEqual(self.get_counts("region"), {"40,-80": 2})
+
+        stats.rebuild()
+        self.assertEqual(self.get_counts("region"), {"-20,-80": 2})
+        self.assertEqual(self.get_counts("genus"), {str(self.genus.pk): 2})
+
+    def test_statistics_endpoints(self):
+        self.create_flight()
+        client = APIClient()
+
+        response = client.get("/api/stats/", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data), stats.DIMENSIONS)
+
+        response = client.get("/api/stats/genus/", secure=True)
+        self.assertEqual(response.data, [{"key": str(self.genus.pk), "count": 1, "name": "Lasius"}])
+
+        response = client.get("/api/stats/colour/", secure=True)
+        self.assertEqual(response.status_code, 404)
+
+    def test_status_refresh_moves_counts(self):
+        self.create_flight()
+        self.create_flight(validatedBy=self.validator.flightuser, validatedAt=timezone.now())
+        self.assertEqual(self.get_counts("status"), {"0": 1, "1": 1})
+
+        self.user.flightuser.flag()
+        self.assertEqual(self.get_counts("status"), {"-1": 2})
+
+        self.user.flightuser.unflag()
+        self.validator.flightuser.flag()
+        self.assertEqual(self.get_counts("status"), {"0": 2})
+
+        stats.rebuild(["status"])
+        self.assertEqual(self.get_counts("status"), {"0": 2})
+
+
+class SnapshotRangeTests(SimpleTestCase):
+    def test_parse_range(self):
+        self.assertEqual(snapshots.parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(snapshots.parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(snapshots.parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(snapshots.parse_range("bytes=500-5000", 1000), (500, 999))
+
+    def test_ignored_ranges(self):
+        self.assertIsNone(snapshots.parse_range(None, 1000))
+        self.assertIsNone(snapshots.parse_range("bytes=0-9,20-29", 1000))
+        self.assertIsNone(snapshots.parse_range("bytes=10-5", 1000))
+        self.assertIsNone(snapshots.parse_range("items=0-9", 1000))
+
+    def test_unsatisfiable_range(self):
+        with self.assertRaises(ValueError):
+            snapshots.parse_range("bytes=1000-", 1000)
+
+
+class SnapshotTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        patcher = mock.patch.object(snapshots, "SNAPSHOT_DIR", os.path.join(directory.name, "exports"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        settings = self.settings(SNAPSHOT_CACHE_DIR=os.path.join(directory.name, "cache"))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.create_fixtures("exporter")
+        self.create_flight()
+
+    def create_flight(self):
+        flight = super().create_flight()
+        Comment.objects.create(author=self.user, text="Lots of queens", time=flight.dateRecorded, responseTo=flight)
+
+        return flight
+
+    def get_files(self):
+        return sorted(name for name in os.listdir(snapshots.SNAPSHOT_DIR) if name.startswith(snapshots.FILE_PREFIX))
+
+    def test_refresh_only_when_stale(self):
+        first = snapshots.refresh()
+        self.assertEqual((first["flights"], first["rendered"]), (1, 1))
+        self.assertIsNone(snapshots.refresh())
+
+        self.create_flight()
+        second = snapshots.refresh()
+        self.assertEqual((second["flights"], second["rendered"]), (2, 1))
+        self.assertNotEqual(first["files"]["csv"]["name"], second["files"]["csv"]["name"])
+
+        # The previous files are kept for one more refresh
+        self.assertEqual(self.get_files(), sorted(snapshots.get_file_names(first) | snapshots.get_file_names(second)))
+
+        self.create_flight()
+        third = snapshots.refresh()
+        self.assertEqual(self.get_files(), sorted(snapshots.get_file_names(second) | snapshots.get_file_names(third)))
+
+    def test_cached_rows_render_the_same(self):
+        first = snapshots.refresh()
+        second = snapshots.refresh(force=True)
+
+        self.assertEqual(second["rendered"], 0)
+
+        # XLSX files hold their creation time, the other formats are identical
+        for file_format in ["csv", "json", "parquet", "weather.parquet"]:
+            self.assertEqual(first["files"][file_format]["etag"], second["files"][file_format]["etag"])
+
+    def test_range_with_if_range(self):
+        snapshot = snapshots.refresh()["files"]["json"]
+        factory = RequestFactory()
+
+        request = factory.get("/", HTTP_RANGE="bytes=0-0", HTTP_IF_RANGE=snapshot["etag"])
+        response = snapshots.snapshot_response(request, "json", snapshot)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 0-0/{snapshot['size']}")
+        self.assertEqual(b"".join(response.streaming_content), b"[")
+
+        # A client holding an older snapshot gets the whole current file
+        request = factory.get("/", HTTP_RANGE="bytes=0-0", HTTP_IF_RANGE='"older"')
+        response = snapshots.snapshot_response(request, "json", snapshot)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b"".join(response.streaming_content)), snapshot["size"])
+        self.assertIn('filename="FlightData.json"', response["Content-Disposition"])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold(self):
+        breaker = httpclient.CircuitBreaker(threshold=2, reset=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+    def test_single_trial_after_reset(self):
+        breaker = httpclient.CircuitBreaker(threshold=1, reset=0)
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = httpclient.CircuitBreaker(threshold=3, reset=60)
+
+        for _ in range(3):
+            breaker.record_failure()
+
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+
+@override_settings(WEATHER_PROVIDER="local")
+class WeatherJobTests(FlightTestMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures("reporter")
+
+    def create_flight(self, date):
+        return super().create_flight(dateOfFlight=date, dateRecorded=timezone.now())
+
+    def test_enqueue_once_per_flight(self):
+        flight = self.create_flight(timezone.now())
+        weatherjobs.enqueue(flight)
+        weatherjobs.enqueue(flight)
+
+        self.assertEqual(WeatherJob.objects.filter(flight=flight).count(), 1)
+
+    def test_run_pending(self):
+        current = self.create_flight(timezone.now())
+        recent = self.create_flight(timezone.now() - timezone.timedelta(days=1))
+        old = self.create_flight(timezone.now() - timezone.timedelta(days=30))
+
+        for flight in [current, recent, old]:
+            weatherjobs.enqueue(flight)
+
+        statuses = weatherjobs.run_pending(max_workers=1)
+
+        self.assertEqual(sorted(statuses), [WeatherJob.DONE, WeatherJob.DONE, WeatherJob.SKIPPED])
+        self.assertTrue(Weather.objects.filter(flight=current).exists())
+        self.assertTrue(Weather.objects.filter(flight=recent).exists())
+        self.assertFalse(Weather.objects.filter(flight=old).exists())
+
+    def test_failed_job_is_retried_later(self):
+        flight = self.create_flight(timezone.now())
+        weatherjobs.enqueue(flight)
+
+        with self.settings(WEATHER_PROVIDER="unknown"):
+            self.assertEqual(weatherjobs.run_pending(max_workers=1), [WeatherJob.PENDING])
+
+        job = WeatherJob.objects.get(flight=flight)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertFalse(Weather.objects.filter(flight=flight).exists())
+
+        # Not due yet
+        self.assertEqual(weatherjobs.run_pending(max_workers=1), [])
+
+
+# The backfill fetches in worker threads, which only see committed rows
+@override_settings(WEATHER_PROVIDER="local")
+class WeatherBackfillTests(FlightTestMixin, TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, "backfill.json")
+
+        weather.get_cache().clear()
+
+        self.create_fixtures("backfiller")
+
+        now = timezone.now()
+        self.flights = [
+            self.create_flight(45.5, -73.6, dateOfFlight=now),
+            self.create_flight(45.5, -73.6, dateOfFlight=now),
+            self.create_flight(48.85, 2.35, dateOfFlight=now - timezone.timedelta(days=3), dateRecorded=now),
+        ]
+
+    def backfill(self, **options):
+        output = StringIO()
+        call_command("backfillweather", checkpoint=self.checkpoint, rate=0, workers=2, stdout=output, **options)
+        return output.getvalue()
+
+    def read_checkpoint(self):
+        with open(self.checkpoint) as file:
+            return json.load(file)
+
+    def test_backfill(self):
+        output = self.backfill()
+
+        self.assertIn("Fetching the weather of 3 flights in 2 groups", output)
+        self.assertEqual(Weather.objects.count(), 3)
+        self.assertEqual(self.read_checkpoint(), {"fetched": 3, "failed": {}})
+
+        self.assertIn("Fetching the weather of 0 flights", self.backfill())
+
+    def test_limit(self):
+        self.backfill(limit=1)
+        self.assertEqual(list(Weather.objects.values_list("flight_id", flat=True)), [self.flights[0].flightID])
+
+        self.backfill()
+        self.assertEqual(self.read_checkpoint()["fetched"], 3)
+
+    def test_failed_flights_are_skipped_until_retried(self):
+        with self.settings(WEATHER_PROVIDER="unknown"):
+            self.backfill(max_age=1)
+
+        self.assertEqual(Weather.objects.count(), 0)
+        self.assertEqual(sorted(self.read_checkpoint()["failed"]), sorted(str(flight.flightID) for flight in self.flights[:2]))
+
+        self.assertIn("Fetching the weather of 1 flights", self.backfill())
+        self.assertIn("Fetching the weather of 2 flights", self.backfill(retry_failed=True))
+        self.assertEqual(Weather.objects.count(), 3)
+        self.assertEqual(self.read_checkpoint(), {"fetched": 3, "failed": {}})
+
+
+@override_settings(WEATHER_PROVIDER="local", WEATHER_CACHE_GRID=0.05)
+class WeatherCacheTests(SimpleTestCase):
+    def setUp(self):
+        weather.get_cache().clear()
+        self.time = timezone.now().replace(minute=10)
+
+    def test_cache_key(self):
+        key = weather.get_cache_key(45.501, -73.601, False, self.time)
+
+        self.assertEqual(key, weather.get_cache_key(45.502, -73.602, False, self.time.replace(minute=50)))
+        self.assertNotEqual(key, weather.get_cache_key(45.6, -73.601, False, self.time))
+        self.assertNotEqual(key, weather.get_cache_key(45.501, -73.601, True, self.time))
+        self.assertNotEqual(key, weather.get_cache_key(45.501, -73.601, False, self.time + timezone.timedelta(hours=1)))
+
+    def test_nearby_flights_share_response(self):
+        first = weather.get_weather_for_location(45.501, -73.601, time=self.time)
+        second = weather.get_weather_for_location(45.502, -73.602, time=self.time)
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            weather.get_cache().get(weather.get_cache_key(45.502, -73.602, False, self.time)), first
+        )
+
+
+class WeatherPayloadTests(FlightTestMixin, TestCase):
+    """
+    The weather is stored in a single row, but the payloads keep the groups
+    of the former weather tables.
+    """
+
+    def setUp(self):
+        self.create_fixtures("reporter")
+        self.flight = self.create_flight()
+
+    def test_weather_groups(self):
+        weather = Weather.objects.create(flight=self.flight, desc="Rain", temperature=18.5, has_rain=True, rain1=1.5)
+        data = WeatherSerializer(weather).data
+
+        self.assertEqual(list(data), ["flightID", "description", "weather", "day", "rain", "wind", "timeFetched"])
+        self.assertEqual(data["description"], {"desc": "Rain", "longDesc": ""})
+        self.assertEqual(data["weather"]["temperature"], 18.5)
+        self.assertEqual(list(data["day"]), ["sunrise", "sunset"])
+        self.assertEqual(data["rain"], {"rain1": 1.5, "rain3": 0})
+        self.assertIsNone(data["wind"])
+
+    def test_flat_weather(self):
+        weather = Weather.objects.create(flight=self.flight, has_wind=True, windSpeed=3.0, windDegree=90)
+        data = FlatWeatherSerializer(weather).data
+
+        self.assertIsNone(data["rain1"])
+        self.assertIsNone(data["rain3"])
+        self.assertEqual(data["windSpeed"], 3.0)
+        self.assertEqual(data["windDegree"], 90)
@@ -0,0 +1,152 @@
+#
+#  tiles.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Map tiles for the flight map.
+
+Each tile covers one web mercator (XYZ) tile. At low zoom levels, flights are
+grouped into a grid of cells and only the number of flights and their mean
+position is returned for each cell. At high zoom levels, the individual
+flights are returned to authenticated users, as long as there are not too
+many of them. Anonymous users only ever get clusters, since flight positions
+and dates are not public. Either way, the size of a tile does not grow with
+the number of flights recorded.
+
+Tiles are cached by position, filters, authentication and the current data
+versions, so any change to the flights invalidates them.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F
+from django.db.models.functions import Floor
+
+from . import geo
+from .models import DataVersion
+
+MAX_ZOOM = 22
+
+# Below this zoom level, tiles always contain clusters.
+POINTS_MIN_ZOOM = 10
+
+# Number of cells along each side of a tile when clustering.
+GRID_SIZE = 32
+
+# Tiles with more flights than this are clustered, whatever the zoom level.
+MAX_POINTS = 500
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+def is_valid_tile(zoom, x, y):
+    return 0 <= zoom <= MAX_ZOOM and 0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom
+
+def get_filter_hash(query_params):
+    """
+    Hash the query parameters so that tiles with different filters are cached
+    separately, whatever the order of the parameters.
+    """
+    items = sorted((key, value) for key in query_params for value in query_params.getlist(key))
+    raw = "&".join(f"{key}={value}" for key, value in items)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def get_tile_version(zoom, x, y, query_params, authenticated):
+    flights_version = DataVersion.current("flights")
+    users_version = DataVersion.current("users")
+    audience = "users" if authenticated else "public"
+    return f"{zoom}-{x}-{y}-{audience}-{get_filter_hash(query_params)}-{flights_version}-{users_version}"
+
+def get_cluster_features(queryset, bounds):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    cell_width = (max_lon - min_lon) / GRID_SIZE
+    cell_height = (max_lat - min_lat) / GRID_SIZE
+
+    cells = (
+        queryset.annotate(
+            cell_x=Floor((F("longitude") - min_lon) / cell_width),
+            cell_y=Floor((F("latitude") - min_lat) / cell_height),
+        )
+        .values("cell_x", "cell_y")
+        .annotate(
+            count=Count("flightID"),
+            mean_latitude=Avg("latitude"),
+            mean_longitude=Avg("longitude"),
+        )
+        .order_by()
+    )
+
+    return [
+        {
+            "latitude": cell["mean_latitude"],
+            "longitude": cell["mean_longitude"],
+            "count": cell["count"],
+        }
+        for cell in cells
+    ]
+
+def get_point_features(queryset):
+    """
+    Return the flights in the tile, or `None` if there are too many of them.
+    """
+    flights = list(
+        queryset.values(
+            "flightID", "latitude", "longitude", "dateOfFlight", "genus__name", "species__name"
+        ).order_by("flightID")[:MAX_POINTS + 1]
+    )
+
+    if len(flights) > MAX_POINTS:
+        return None
+
+    return [
+        {
+            "flightID": flight["flightID"],
+            "latitude": flight["latitude"],
+            "longitude": flight["longitude"],
+            "dateOfFlight": flight["dateOfFlight"],
+            "genus": flight["genus__name"],
+            "species": flight["species__name"],
+        }
+        for flight in flights
+    ]
+
+def build_tile(queryset, zoom, x, y, authenticated):
+    bounds = geo.tile_bounds(zoom, x, y)
+    queryset = geo.filter_bounding_box(queryset.order_by(), *bounds)
+
+    if authenticated and zoom >= POINTS_MIN_ZOOM:
+        points = get_point_features(queryset)
+
+        if points is not None:
+            return {"type": "points", "features": points}
+
+    return {"type": "clusters", "features": get_cluster_features(queryset, bounds)}
+
+def get_tile(queryset, zoom, x, y, tile_version, authenticated):
+    """
+    Return the tile data, building it only if it is not cached for this
+    version of the data. Only authenticated users get individual flights.
+    """
+    key = f"flight-tile:{tile_version}"
+    tile = cache.get(key)
+
+    if tile is None:
+        tile = build_tile(queryset, zoom, x, y, authenticated)
+        cache.set(key, tile, CACHE_TIMEOUT)
+
+    return tile
@@ -22,7 +22,7 @@ from django.urls import path, include, re_path
 from rest_framework.urlpatterns import format_suffix_patterns
 # from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
-from .pandasViews import FlightDataExport
+from .pandasViews import FlightDataExport, FlightParquetExport
 from . import views
 
 DEVELOPMENT_MODE = False
@@ -56,6 +56,8 @@ urlpatterns = [
     # path('api/flights/<int:pk>/validate-flight/', views.ValidateInvalidateFlight.as_view()),
     path('api/flights/download', FlightDataExport.as_view(), name='downloadview'),
     path('api/flights/download-json', views.FlightListNested.as_view(), name='nestedjson'),
+    path('api/flights/download-parquet', FlightParquetExport.as_view(), name='parquetview'),
+    path('api/flights/snapshots/<str:file_format>', views.SnapshotView.as_view(), name='snapshot'),
     path('api/my-flights/', views.MyFlightsList.as_view()),
     path('api/my-species/', views.MySpeciesList.as_view()),
     path('api/my-genera/', views.MyGenusList.as_view()),
@@ -87,6 +89,9 @@ urlpatterns = [
     path('app-license/', views.applicense, name="applicense"),
     path('server-license/', views.serverlicense, name="serverlicense"),
     path('api/taxonomy-version/', views.TaxonomyVersionView.as_view(), name="taxonomy-version"),
+    path('api/stats/', views.StatisticsView.as_view(), name="stats"),
+    path('api/stats/<str:dimension>/', views.StatisticsDimensionView.as_view(), name="stats-dimension"),
+    path('api/metrics/', views.MetricsView.as_view(), name="metrics"),
     # path('user_management/', include('django.contrib.auth.urls')),
 ]
 
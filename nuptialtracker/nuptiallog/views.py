@@ -27,14 +27,17 @@ from django.contrib.auth.models import User
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import EmailMessage
-from django.db.models import Count, Q
+from django.db.models import F, Prefetch, Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.utils.encoding import force_bytes, force_str
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.views import generic
+from django.views.decorators.http import condition
 from knox.auth import TokenAuthentication
 from knox.views import LoginView as KnoxLoginView
 from nuptialtracker.settings import MEDIA_ROOT
@@ -45,27 +48,39 @@ from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.authentication import BasicAuthentication
 from rest_framework.decorators import action
-from rest_framework.exceptions import ParseError
+from rest_framework.exceptions import NotFound, ParseError, PermissionDenied
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .exceptions import BadLocationUrlException
+from .exceptions import BadDistanceUrlException, BadLocationUrlException, BadNearestUrlException
+from . import conditional
+from . import exports
+from . import fastserializers
+from . import flightcache
 from . import forms
+from . import geo
+from . import httpclient
 
 # from django_filters.rest_framework import DjangoFilterBackend
 from . import models
 from . import notifications
+from . import paginators
 
 # from .faq import getFaqs
 from .parsers import ImageUploadParser
+from .renderers import NDJSONRenderer
 
 # from .permissions import IsOwnerOrReadOnly, IsOwner, IsProfessional, IsProfessionalOrReadOnly, IsAuthor, IsAuthorOrReadOnly
 from . import permissions
 from . import serializers
-from .taxonomy import SPECIES
+from . import snapshots
+from . import stats
+from .taxonomy import SPECIES, TAXONOMY_INDEX
+from . import tiles
 from . import tokens
-from .weather import get_weather_for_flight
+from .weather import get_cache_statistics as get_weather_cache_statistics
+from . import weatherjobs
 
 
 # from django.contrib.auth import login, authenticate
@@ -129,6 +144,7 @@ class SpeciesDetailView(APIView):
 class MyFlightsList(mixins.ListModelMixin, generics.GenericAPIView):
     serializer_class = serializers.FlightSerializerBarebones
     permission_classes = [permissions.permissions.IsAuthenticated]
+    pagination_class = paginators.FlightKeysetPaginator
 
     def get_queryset(self):
         return serializers.Flight.objects.all().filter(owner=self.request.user)
@@ -307,6 +323,7 @@ class ChangelogForFlight(mixins.ListModelMixin, generics.GenericAPIView):
         return (
             serializers.Changelog.objects.all()
             .filter(flight_id=self.kwargs["pk"])
+            .select_related("user")
             .order_by("-date")
         )
 
@@ -335,6 +352,7 @@ class WeatherForFlight(mixins.RetrieveModelMixin, generics.GenericAPIView):
         except:
             return None
 
+    @method_decorator(condition(etag_func=conditional.weather_etag, last_modified_func=conditional.weather_last_modified))
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
 
@@ -873,18 +891,45 @@ class UserDetailView(mixins.RetrieveModelMixin, generics.GenericAPIView):
 
 
 class FlightListNested(APIView):
+    """
+    All flights with their comments and weather, streamed as a JSON array or,
+    with `Accept: application/x-ndjson`, as newline delimited JSON.
+    """
     serializer_class = serializers.FlightSerializerFull
-    renderer_classes = [JSONRenderer]
+    renderer_classes = [JSONRenderer, NDJSONRenderer]
     permission_classes = [permissions.permissions.IsAuthenticated]
     authentication_classes = [BasicAuthentication]
 
-    def get_data(self):
-        flights = serializers.Flight.objects.all()
-        serializer = serializers.FlightSerializerFull(flights, many=True)
-        return serializer.data
+    def get_items(self):
+        fieldset = serializers.get_fieldset(self.request.query_params)
+        flights = serializers.FlightSerializerFull.optimize_queryset(
+            serializers.Flight.objects.order_by("flightID"), **fieldset
+        )
+        return exports.iter_serialized(
+            flights, serializers.FlightSerializerFull, context={"request": self.request}, **fieldset
+        )
 
     def get(self, request, *args, **kwargs):
-        return Response(self.get_data(), status=status.HTTP_200_OK)
+        return exports.streaming_json_response(self.get_items(), request.accepted_renderer)
+
+
+class SnapshotView(APIView):
+    """
+    Latest precomputed snapshot of the flight data in a given format, with
+    support for conditional and range requests.
+    """
+    permission_classes = [permissions.permissions.IsAuthenticated]
+    authentication_classes = [BasicAuthentication]
+
+    @method_decorator(condition(etag_func=conditional.snapshot_etag, last_modified_func=conditional.snapshot_last_modified))
+    def get(self, request, file_format, *args, **kwargs):
+        snapshot = conditional.get_snapshot(request, file_format)
+        response = snapshots.snapshot_response(request, file_format, snapshot) if snapshot is not None else None
+
+        if response is None:
+            raise NotFound(f"No snapshot available in format '{file_format}'.")
+
+        return response
 
 
 class ScientistImageView(APIView):
@@ -908,12 +953,23 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
     serializer class is used for listing the flights and for creating them.
     """
 
-    pagination_class = None
+    pagination_class = paginators.FlightKeysetPaginator
     filter_backends = [filters.OrderingFilter]
     serializer_class = serializers.FlightSerializer
-    ordering_fields = ["flightID", "dateOfFlight", "dateRecorded"]
+    ordering_fields = ["flightID", "dateOfFlight", "dateRecorded", "lastUpdated"]
     ordering = ["-flightID"]
 
+    # Watermarks handed out by the changes endpoint lag behind the current time
+    # by this much, so that writes still in flight when a client polls are
+    # picked up by its next poll.
+    changes_overlap = timezone.timedelta(seconds=30)
+
+    # Tiles are revalidated with their ETag once this many seconds have passed.
+    tile_max_age = 60
+
+    # Maximum number of flights requested at once from the batch endpoint.
+    batch_max_size = 200
+
     # queryset = Flight.objects.all()
 
     # def get_serializer_class(self):
@@ -929,10 +985,69 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         if self.action == "verify":
             return [permissions.IsProfessionalOrReadOnly()]
 
+        if self.action == "changes":
+            # The changes hold the full payload of each flight, which only
+            # authenticated users may see.
+            return [permissions.permissions.IsAuthenticated()]
+
+        if self.action == "batch":
+            # POST is only used to send long lists of ids, so the batch is
+            # read-only whatever the method.
+            return [permissions.permissions.IsAuthenticated()]
+
         return [permissions.IsOwnerOrReadOnly()]
 
-    def get_queryset(self):
+    def get_fieldset(self):
+        """
+        Return the sparse fieldset requested for the flight payloads. Only
+        authenticated users may see flight details, so anonymous users always
+        get the plain list.
+        """
+        if not self.request.user.is_authenticated:
+            return {}
+
+        return serializers.get_fieldset(self.request.query_params)
+
+    def get_action_queryset(self):
+        """
+        Return the flights queryset for the current action, joining and
+        prefetching exactly the relations that its serializer reads.
+        """
         queryset = serializers.Flight.objects.all()
+        fieldset = self.get_fieldset()
+
+        if self.action == "list" and fieldset:
+            return serializers.FlightSerializer.optimize_queryset(queryset, **fieldset)
+
+        if self.action == "list":
+            return queryset.only("flightID", "last_updated", "dateOfFlight", "dateRecorded")
+
+        if self.action in ["retrieve", "batch"]:
+            return serializers.FlightSerializer.optimize_queryset(queryset, **fieldset)
+
+        if self.action in ["update", "changes"]:
+            return queryset.select_related(
+                "owner__flightuser", "validatedBy__user", "species", "weather"
+            ).prefetch_related(
+                Prefetch(
+                    "comments",
+                    queryset=serializers.Comment.objects.select_related("author__flightuser"),
+                )
+            )
+
+        if self.action in ["verify", "verify_flight"]:
+            return queryset.select_related("owner__flightuser", "validatedBy__user")
+
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == "retrieve":
+            kwargs.update(self.get_fieldset())
+
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = self.get_action_queryset()
 
         max_date = self.request.query_params.get("max_date")
         min_date = self.request.query_params.get("min_date")
@@ -950,7 +1065,9 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
 
         has_images = self.request.query_params.get("has_images")
 
-        # max_distance = self.request.query_params.get("within")
+        max_distance = self.request.query_params.get("within")
+
+        bounding_box = self.request.query_params.get("bbox")
 
         user = self.request.query_params.get("user")
 
@@ -959,20 +1076,10 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         if taxonomy_raw != None:
             taxonomy_list = taxonomy_raw.split(",")
             # taxonomy_list = [entry.replace('+', ' ') for entry in taxonomy_list]
-            taxonomy_list = [entry.split(" ", maxsplit=1) for entry in taxonomy_list]
-
-            genera = [entry[0] for entry in taxonomy_list if len(entry) == 1]
-            species_list = [
-                serializers.Species.objects.get(genus__name=entry[0], name=entry[1])
-                for entry in taxonomy_list
-                if len(entry) > 1
-            ]
-
-            # print(genera)
-            # print(species_list)
+            genus_ids, species_ids = TAXONOMY_INDEX.resolve(taxonomy_list)
 
             queryset = queryset.filter(
-                Q(genus__name__in=genera) | Q(species__in=species_list)
+                Q(genus_id__in=genus_ids) | Q(species_id__in=species_ids)
             )
             # queryset = queryset.filter(species__in=species_list)
 
@@ -1005,30 +1112,36 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
 
         if verified != None:
             if verified == "true":
-                queryset = queryset.filter(
-                    Q(owner__flightuser__professional=True)
-                    & Q(owner__flightuser__flagged=False)
-                    | Q(validatedBy__isnull=False)
-                )
+                queryset = queryset.filter(models.validated_condition())
             elif verified == "false":
-                queryset = queryset.exclude(
-                    Q(owner__flightuser__professional=True)
-                    | Q(validatedBy__isnull=False)
-                )
+                queryset = queryset.filter(models.validated_condition(False))
 
-        if has_images != None:
-            queryset = queryset.annotate(Count("images"))
+        if max_distance != None:
+            reference_point = geo.parse_location(location)
+
+            if reference_point is None:
+                raise BadDistanceUrlException
+
+            queryset = geo.filter_within(
+                queryset, reference_point, geo.parse_distance(max_distance)
+            )
+
+        if bounding_box != None:
+            queryset = geo.filter_bounding_box(
+                queryset, *geo.parse_bounding_box(bounding_box)
+            )
 
+        if has_images != None:
             if has_images == "true":
-                queryset = queryset.exclude(images__count=0)
+                queryset = queryset.filter(image_count__gt=0)
             elif has_images == "false":
-                queryset = queryset.filter(images__count=0)
+                queryset = queryset.filter(image_count=0)
 
         if ordering == None:
             return queryset
 
-        # if (ordering in ["lastUpdated", "-lastUpdated"]):
-        #     queryset = queryset.annotate(lastUpdated=F("changes"))
+        if ordering in ["lastUpdated", "-lastUpdated"]:
+            queryset = queryset.annotate(lastUpdated=F("last_updated"))
 
         if location != None and ordering.lower() in ["location", "-location"]:
             location_split = location.split(",")
@@ -1047,13 +1160,6 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
                 else:
                     queryset = queryset.order_by("-distance")
 
-                # if (max_distance != None):
-                #     try:
-                #         max_distance_float = float(max_distance)
-                #         queryset = queryset.filter(location__distance_lte=(reference_point, D(max_distance_float)))
-                #     except ValueError:
-                #         pass
-
                 # for f in queryset:
                 #     print("Flight {}: Distance is {}".format(f.flightID, f.distance))
 
@@ -1103,11 +1209,93 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         # sendAllNotifications("Flight Created", body, devices, flightID=flight.flightID)
         notifications.send_notifications(devices=devices, title=title, body=body)
 
+    @method_decorator(condition(etag_func=conditional.flight_list_etag))
     def list(self, request, format=None):
         queryset = self.get_queryset()
         # sorted_queryset = filters.OrderingFilter().filter_queryset(request, queryset, self)
-        serializer = serializers.SimpleFlightSerializer(queryset, many=True)
-        return Response(serializer.data)
+
+        nearest = request.query_params.get("nearest")
+
+        if nearest != None:
+            reference_point = geo.parse_location(request.query_params.get("loc"))
+
+            if reference_point is None:
+                raise BadNearestUrlException
+
+            flights = geo.nearest_flights(queryset, reference_point, geo.parse_nearest(nearest))
+            page = self.paginator.paginate_nearest(flights, request)
+            fieldset = self.get_fieldset()
+
+            if page is not None:
+                flights = page
+
+            if fieldset:
+                data = serializers.FlightSerializer(
+                    flights, many=True, context=self.get_serializer_context(), **fieldset
+                ).data
+                data = [dict(payload, distance=flight.distance.km) for payload, flight in zip(data, flights)]
+            else:
+                data = serializers.NearbyFlightSerializer(flights, many=True).data
+
+            if page is not None:
+                return self.get_paginated_response(data)
+
+            return Response(data)
+
+        page = self.paginate_queryset(queryset)
+        fieldset = self.get_fieldset()
+        order = None
+
+        if page is not None:
+            # Build the payloads of the page from a values() query as well,
+            # in the order of the page
+            order = [flight.pk for flight in page]
+            queryset = queryset.filter(pk__in=order)
+
+        if not fieldset:
+            data = fastserializers.simple_flights(queryset, order=order)
+        elif fastserializers.supports(fieldset):
+            data = fastserializers.flights(queryset, request=request, order=order, **fieldset)
+        else:
+            flights = page if page is not None else queryset
+            data = serializers.FlightSerializer(
+                flights, many=True, context=self.get_serializer_context(), **fieldset
+            ).data
+
+        if page is not None:
+            return self.get_paginated_response(data)
+
+        return Response(data)
+
+    @method_decorator(condition(etag_func=conditional.flight_etag))
+    def retrieve(self, request, pk=None, *args, **kwargs):
+        validators = conditional.get_flight_validators(request, pk)
+
+        if validators is None:
+            return super().retrieve(request, pk=pk, *args, **kwargs)
+
+        version, owner_id = validators
+
+        # The permissions only look at the owner, so check them against a
+        # placeholder flight before looking for a cached payload.
+        self.check_object_permissions(
+            request, serializers.Flight(flightID=pk, owner_id=owner_id, version=version)
+        )
+
+        fieldset = self.get_fieldset()
+
+        def build():
+            return self.get_serializer(self.get_object()).data
+
+        data = flightcache.get_flight_data(
+            pk,
+            version,
+            conditional.get_users_version(request),
+            flightcache.get_variant(request, fieldset),
+            build,
+        )
+
+        return Response(data)
 
     def create(self, request, format=None):
         serializer = serializers.FlightSerializerBarebones(data=self.request.data)
@@ -1153,9 +1341,7 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
             longitude=location.x,
         )
 
-        weatherThread = Thread(target=get_weather_for_flight, args=(flight,))
-
-        weatherThread.start()
+        weatherjobs.enqueue(flight)
 
         notificationThread = Thread(
             target=self.notify_users_flight_creation, args=[flight]
@@ -1341,7 +1527,7 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
 
     @action(detail=True, methods=["GET"])
     def verify(self, request, pk=None, format=None):
-        flight = serializers.Flight.objects.get(pk=pk)
+        flight = get_object_or_404(self.get_action_queryset(), pk=pk)
 
         if flight.validatedBy:
             username = flight.validatedBy.user.username
@@ -1373,7 +1559,7 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         # if flightID != pk:
         #     return Response({"Errors": "Incorrect flight ID"}, status=status.HTTP_400_BAD_REQUEST)
 
-        flight = serializers.Flight.objects.get(pk=pk)
+        flight = get_object_or_404(self.get_action_queryset(), pk=pk)
 
         validate = serializer.validated_data["validate"]
 
@@ -1430,19 +1616,162 @@ class FlightViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
                 responseSerializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
 
+    def get_batch_ids(self, request):
+        if request.method == "POST":
+            raw_ids = request.data.get("ids") if hasattr(request.data, "get") else None
+        else:
+            raw_ids = request.query_params.get("ids")
+            raw_ids = raw_ids.split(",") if raw_ids else None
+
+        if not isinstance(raw_ids, list) or not raw_ids:
+            raise ParseError("Provide a list of flight ids.")
+
+        try:
+            ids = list(dict.fromkeys(int(flight_id) for flight_id in raw_ids))
+        except (TypeError, ValueError):
+            raise ParseError("Invalid flight id.")
+
+        if len(ids) > self.batch_max_size:
+            raise ParseError(f"Request at most {self.batch_max_size} flights at once.")
+
+        return ids
+
+    @action(detail=False, methods=["GET", "POST"])
+    def batch(self, request, format=None):
+        """
+        Return the details of several flights in one response. The ids are
+        passed as `ids=1,2,3` or, for long lists, posted as `{"ids": [...]}`.
+        Flights that do not exist or cannot be seen are listed as missing.
+        """
+        ids = self.get_batch_ids(request)
+        flights_by_id = {
+            flight.flightID: flight
+            for flight in self.get_queryset().filter(pk__in=ids)
+        }
+
+        flights = []
+        missing = []
+
+        for flight_id in ids:
+            flight = flights_by_id.get(flight_id)
+
+            if flight is None:
+                missing.append(flight_id)
+                continue
+
+            try:
+                self.check_object_permissions(request, flight)
+            except PermissionDenied:
+                missing.append(flight_id)
+                continue
+
+            flights.append(flight)
+
+        serializer = self.get_serializer(
+            flights, many=True, **self.get_fieldset()
+        )
+
+        data = {
+            "flights": serializer.data,
+            "missing": missing,
+        }
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False)
+    def changes(self, request, format=None):
+        """
+        Return the flights created, updated and deleted since the watermark
+        passed in the `since` parameter, along with a new watermark. Updates
+        at the watermark itself are included again, so a client may see a
+        flight twice but never misses one.
+        """
+        since_raw = request.query_params.get("since")
+
+        if since_raw is None:
+            raise ParseError("Provide a watermark using the since parameter.")
+
+        try:
+            since = timezone.datetime.fromtimestamp(int(since_raw), tz=timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise ParseError("Invalid watermark.")
+
+        watermark = timezone.now() - self.changes_overlap
+
+        queryset = self.get_queryset().filter(changed_at__gte=since)
+
+        created = []
+        updated = []
+
+        for flight in queryset:
+            if flight.dateRecorded >= since:
+                created.append(flight)
+            else:
+                updated.append(flight)
+
+        deleted = (
+            models.FlightTombstone.objects.filter(deleted_at__gte=since)
+            .values_list("flightID", flat=True)
+            .distinct()
+        )
+
+        serializer = serializers.FlightSerializer(created + updated, many=True)
+
+        data = {
+            "watermark": str(int(watermark.timestamp())),
+            "created": [flight.flightID for flight in created],
+            "updated": [flight.flightID for flight in updated],
+            "deleted": list(deleted),
+            "flights": serializer.data,
+        }
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, url_path=r"tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)")
+    @method_decorator(condition(etag_func=conditional.flight_tile_etag))
+    def tile(self, request, z=None, x=None, y=None, format=None):
+        """
+        Return the flights in a map tile, as clusters at low zoom levels and as
+        individual flights at high zoom levels. The usual list filters apply.
+        """
+        zoom, x, y = int(z), int(x), int(y)
+
+        if not tiles.is_valid_tile(zoom, x, y):
+            raise NotFound("No such tile.")
+
+        tile_version = conditional.get_tile_version(request, zoom, x, y)
+        data = tiles.get_tile(
+            self.get_queryset(), zoom, x, y, tile_version, request.user.is_authenticated
+        )
+
+        response = Response(data, status=status.HTTP_200_OK)
+
+        # Individual flights are only for the user who asked for them, while
+        # clusters may be kept by shared caches.
+        if data["type"] == "points":
+            patch_cache_control(response, private=True, max_age=self.tile_max_age)
+        else:
+            patch_cache_control(response, public=True, max_age=self.tile_max_age)
+
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
     @action(detail=True)
     def history(self, request, pk=None, format=None):
-        flight = get_object_or_404(serializers.Flight.objects.all(), flightID=pk)
+        flight = get_object_or_404(serializers.Flight.objects.only("flightID"), flightID=pk)
         changelog_entries = (
-            serializers.Changelog.objects.all().filter(flight=flight).order_by("-date")
+            serializers.Changelog.objects.filter(flight=flight)
+            .select_related("user")
+            .order_by("-date")
         )
         serializer = serializers.ChangelogSerializer(changelog_entries, many=True)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True)
+    @method_decorator(condition(etag_func=conditional.weather_etag, last_modified_func=conditional.weather_last_modified))
     def weather(self, request, pk=None, format=None):
-        weather = get_object_or_404(serializers.Weather.objects.all(), flight_id=pk)
+        weather = get_object_or_404(serializers.Weather, flight_id=pk)
         serializer = serializers.WeatherSerializer(weather)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -1618,10 +1947,51 @@ class FlightImageViewSet(
     #     flight_image.delete()
 
 
+class MetricsView(APIView):
+    """
+    Operational metrics, for administrators.
+    """
+    permission_classes = [permissions.permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        data = {
+            "flightCache": flightcache.get_statistics(),
+            "weatherCache": get_weather_cache_statistics(),
+            "upstreams": httpclient.get_statistics(),
+        }
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class StatisticsView(APIView):
+    """
+    Precomputed flight counts for every statistics dimension.
+    """
+
+    @method_decorator(condition(etag_func=conditional.statistics_etag))
+    def get(self, request, *args, **kwargs):
+        data = {dimension: stats.get_statistics(dimension) for dimension in stats.DIMENSIONS}
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class StatisticsDimensionView(APIView):
+    """
+    Precomputed flight counts for one statistics dimension.
+    """
+
+    @method_decorator(condition(etag_func=conditional.statistics_etag))
+    def get(self, request, dimension, *args, **kwargs):
+        if dimension not in stats.DIMENSIONS:
+            raise NotFound(f"No statistics for '{dimension}'.")
+
+        return Response(stats.get_statistics(dimension), status=status.HTTP_200_OK)
+
+
 class TaxonomyVersionView(APIView):
 
     # permission_classes = [permissions.IsAuthenticated]
 
+    @method_decorator(condition(etag_func=conditional.taxonomy_etag, last_modified_func=conditional.taxonomy_last_modified))
     def get(self, request, *args, **kwargs):
         taxonomy = serializers.Taxonomy.objects.last()
         serializer = serializers.TaxonomyVersionSerializer(taxonomy)
@@ -1633,6 +2003,7 @@ class FullTaxonomyView(APIView):
     API view that returns all genera and species.
     """
 
+    @method_decorator(condition(etag_func=conditional.taxonomy_etag, last_modified_func=conditional.taxonomy_last_modified))
     def get(self, request, *args, **kwargs):
         taxonomy = serializers.Taxonomy.objects.last()
         genera = taxonomy.genera
@@ -1657,7 +2028,7 @@ def download(request, update_development=False):
     return render(
         request,
         "nuptiallog/DownloadData.html",
-        {"formats": formats, "update_development": update_development},
+        {"formats": formats, "snapshot": snapshots.get_manifest(), "update_development": update_development},
     )
 
 
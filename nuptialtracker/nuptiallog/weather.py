@@ -18,10 +18,14 @@
 #
 
 # import json
-import requests
-from .models import Weather, Flight, WeatherDescription, BasicWeatherData, DayInfo, WindInfo, RainInfo
+from .models import Weather, Flight
+from django.conf import settings
+from django.core.cache import caches
 from django.utils import timezone
+from . import httpclient
+from . import metrics
 import datetime
+import math
 import os
 
 def generate_url_coord(lat, lon):
@@ -40,66 +44,141 @@ def generate_url_one_call_coord(lat, lon, time):
     # print(url)
     return url
 
-def get_weather_for_location(lat, lon, old=False, time=None):
+def get_openweathermap_weather(lat, lon, old=False, time=None):
     if old:
         url = generate_url_one_call_coord(lat, lon, time)
     else:
         url = generate_url_coord(lat, lon)
-    response = requests.get(url)
+    response = httpclient.get(url)
+    response.raise_for_status()
     return response.json()
 
+def get_local_weather(lat, lon, old=False, time=None):
+    """
+    Stand-in for OpenWeatherMap, making up weather in the same format without
+    any network access. The weather only depends on the location and time.
+    """
+    time = time or timezone.now()
+    day_start = int(time.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+    sunrise = day_start + 6 * 60 * 60
+    sunset = day_start + 20 * 60 * 60
+    temperature = round(25 - abs(lat) / 3, 1)
+    humidity = int(abs(lat + lon)) % 100
+    description = {"main": "Clear", "description": "clear sky"}
+
+    if old:
+        return {
+            "current": {
+                "temp": temperature,
+                "pressure": 1013,
+                "humidity": humidity,
+                "clouds": 0,
+                "wind_speed": 2.5,
+                "wind_deg": 180,
+                "sunrise": sunrise,
+                "sunset": sunset,
+                "weather": [description],
+            },
+        }
+
+    return {
+        "weather": [description],
+        "main": {
+            "temp": temperature,
+            "pressure": 1013,
+            "humidity": humidity,
+            "temp_min": temperature - 2,
+            "temp_max": temperature + 2,
+        },
+        "clouds": {"all": 0},
+        "wind": {"speed": 2.5, "deg": 180},
+        "timezone": 0,
+        "sys": {"sunrise": sunrise, "sunset": sunset},
+    }
+
+WEATHER_PROVIDERS = {
+    "openweathermap": get_openweathermap_weather,
+    "local": get_local_weather,
+}
+
+# Weather response cache
+#
+# Responses are cached by grid cell and hour, so flights reported from the
+# same area within the same hour (such as during a mass flight) share a single
+# API call. The `weather` cache alias sets the lifetime and the number of
+# entries kept, falling back to the default cache if it is not configured.
+
+CACHE_ALIAS = "weather"
+
+HITS_COUNTER = "weather_cache.hits"
+MISSES_COUNTER = "weather_cache.misses"
+
+def get_cache():
+    if CACHE_ALIAS in settings.CACHES:
+        return caches[CACHE_ALIAS]
+
+    return caches["default"]
+
+def get_cache_key(lat, lon, old, time):
+    grid = settings.WEATHER_CACHE_GRID
+    cell_lat = math.floor(lat / grid)
+    cell_lon = math.floor(lon / grid)
+    hour = int(time.timestamp() // 3600)
+    kind = "historical" if old else "current"
+    return f"weather:{settings.WEATHER_PROVIDER}:{kind}:{grid}:{cell_lat}:{cell_lon}:{hour}"
+
+def is_valid_response(weather_data, old):
+    # Errors come back as JSON too, with a code and a message
+    if not isinstance(weather_data, dict):
+        return False
+
+    return "current" in weather_data if old else "main" in weather_data
+
+def get_cache_statistics():
+    counters = metrics.get_counters([HITS_COUNTER, MISSES_COUNTER])
+    hits = counters[HITS_COUNTER]
+    misses = counters[MISSES_COUNTER]
+    lookups = hits + misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hitRate": hits / lookups if lookups else None,
+    }
+
+def get_weather_for_location(lat, lon, old=False, time=None):
+    cache = get_cache()
+    key = get_cache_key(lat, lon, old, time or timezone.now())
+    weather_data = cache.get(key)
+
+    if weather_data is not None:
+        metrics.increment(HITS_COUNTER)
+        return weather_data
+
+    metrics.increment(MISSES_COUNTER)
+    provider = WEATHER_PROVIDERS[settings.WEATHER_PROVIDER]
+    weather_data = provider(lat, lon, old=old, time=time)
+
+    if is_valid_response(weather_data, old):
+        cache.set(key, weather_data)
+
+    return weather_data
+
 def parse_historical_weather(weather_data, time, flight):
     basic_weather_data = weather_data['current']
     # utcoffset = timezone.timedelta(seconds=int(weather_data['timezone_offset']))
     tz = timezone.utc
 
-    temp = basic_weather_data['temp']
-    pressure = basic_weather_data['pressure']
-    humidity = basic_weather_data['humidity']
-    clouds = basic_weather_data['clouds']
-
-    basic_weather = BasicWeatherData.objects.create(
-        temperature=temp,
-        pressure=pressure,
-        pressureSea=None,
-        pressureGround=None,
-        humidity=humidity,
-        clouds=clouds,
-        tempMin=None,
-        tempMax=None
-    )
-
     wind_speed = basic_weather_data.get('wind_speed')
     wind_degree = basic_weather_data.get('wind_deg')
 
-    if wind_speed or wind_degree:
-        wind = WindInfo.objects.create(
-            windSpeed=wind_speed,
-            windDegree=wind_degree
-        )
-    else:
-        wind = None
-
-    try:
-        rain_raw = weather_data['rain']
-        rain1 = rain_raw.get('1h')
-        rain3 = rain_raw.get('3h')
-
-        if rain1 or rain3:
-            rain = RainInfo.objects.create(rain1=rain1, rain3=rain3)
-        else:
-            rain = None
-    except KeyError:
-        rain = None
+    rain_raw = weather_data.get('rain', {})
+    rain1 = rain_raw.get('1h')
+    rain3 = rain_raw.get('3h')
 
     sunrise = timezone.datetime.fromtimestamp(basic_weather_data['sunrise']).replace(tzinfo=tz)# + utcoffset
     sunset = timezone.datetime.fromtimestamp(basic_weather_data['sunset']).replace(tzinfo=tz) #+ utcoffset
 
-    day = DayInfo.objects.create(
-        sunrise=sunrise,
-        sunset=sunset
-    )
-
     desc = ""
     long_desc = ""
 
@@ -110,11 +189,6 @@ def parse_historical_weather(weather_data, time, flight):
     desc = desc.strip()
     long_desc = long_desc.strip()
 
-    description = WeatherDescription.objects.create(
-        desc=desc,
-        longDesc=long_desc
-    )
-
     # tz = timezone.timezone(offset=utcoffset)
 
     # time_fetched = time.replace(microsecond=0) + utcoffset
@@ -122,11 +196,24 @@ def parse_historical_weather(weather_data, time, flight):
 
     weather = Weather.objects.create(
         flight=flight,
-        description=description,
-        weather=basic_weather,
-        day=day,
-        rain=rain,
-        wind=wind,
+        desc=desc,
+        longDesc=long_desc,
+        temperature=basic_weather_data['temp'],
+        pressure=basic_weather_data['pressure'],
+        pressureSea=None,
+        pressureGround=None,
+        humidity=basic_weather_data['humidity'],
+        clouds=basic_weather_data['clouds'],
+        tempMin=None,
+        tempMax=None,
+        sunrise=sunrise,
+        sunset=sunset,
+        has_rain=bool(rain1 or rain3),
+        rain1=rain1,
+        rain3=rain3,
+        has_wind=bool(wind_speed or wind_degree),
+        windSpeed=wind_speed,
+        windDegree=wind_degree,
         timeFetched=time_fetched
     )
 
@@ -148,128 +235,82 @@ def parse_current_weather(weather_data, time, flight):
     desc += weather_descriptions[i]['main']
     long_desc += weather_descriptions[i]['description']
 
-    description = WeatherDescription.objects.create(desc=desc, longDesc=long_desc)
-
     basic_weather = weather_data['main']
-    temperature = basic_weather['temp']
-    pressure = basic_weather['pressure']
-    humidity = basic_weather['humidity']
-    temp_min = basic_weather['temp_min']
-    temp_max = basic_weather['temp_max']
 
     try:
         clouds = weather_data['clouds']['all']
     except KeyError:
         clouds = 0
 
-    pressure_sea = basic_weather.get('sea_level')
-    pressure_ground = basic_weather.get('grnd_level')
-    
-    # try:
-    #     pressure_sea = basic_weather['sea_level']
-    # except KeyError:
-    #     pressure_sea = None
-
-    # try:
-    #     pressure_ground = basic_weather['grnd_level']
-    # except KeyError:
-    #     pressure_ground = None
-
-    weather_info = BasicWeatherData.objects.create(
-        temperature=temperature,
-        pressure=pressure,
-        humidity=humidity,
-        tempMin=temp_min,
-        tempMax=temp_max,
-        pressureSea=pressure_sea,
-        pressureGround=pressure_ground,
-        clouds=clouds
-    )
-
-    try:
-        wind_info_raw = weather_data["wind"]
-        wind_speed = wind_info_raw.get("speed", 0)
-        wind_degree = wind_info_raw.get("deg", 0)
-
-        # try:
-        #     wind_speed = wind_info_raw['speed']
-        # except KeyError:
-        #     wind_speed = 0
-
-        # try:
-        #     wind_degree = wind_info_raw['deg']
-        # except:
-        #     wind_degree = 0
-        wind = WindInfo.objects.create(windSpeed=wind_speed, windDegree=wind_degree)
-
-    except KeyError:
-        wind = None
-
-    utc_offset = timezone.timedelta(seconds=int(weather_data["timezone"]))
+    has_wind = "wind" in weather_data
+    wind_info_raw = weather_data.get("wind", {})
+    has_rain = "rain" in weather_data
+    rain_raw = weather_data.get("rain", {})
 
     # tz = datetime.timezone(offset=utc_offset)
     tz = timezone.utc
 
-    # sunrise = timezone.datetime.fromtimestamp(weather_data['sys']['sunrise']) + utc_offset
-    # sunset = timezone.datetime.fromtimestamp(weather_data['sys']['sunset']) + utc_offset
-    # time_fetched = timezone.now().replace(microsecond=0) + utc_offset
-
     sunrise = timezone.datetime.fromtimestamp(weather_data['sys']['sunrise']).replace(tzinfo=tz)
     sunset = timezone.datetime.fromtimestamp(weather_data['sys']['sunset']).replace(tzinfo=tz)
     time_fetched = timezone.now().replace(microsecond=0, tzinfo=tz)
 
-    day = DayInfo.objects.create(sunrise=sunrise, sunset=sunset)
-
-    try:
-        rain_raw = weather_data['rain']
-        rain1 = rain_raw.get('1h')
-        rain3 = rain_raw.get('3h')
-        
-        rain = RainInfo.objects.create(rain1=rain1, rain3=rain3)
-        
-        # try:
-        #     rain1 = rain_raw['1h']
-        # except KeyError:
-        #     rain1 = None
-
-        # try:
-        #     rain3 = rain_raw['3h']
-        # except KeyError:
-        #     rain3 = None
-
-    except KeyError:
-        rain = None
-
-    # print("Got all variables")
-
     weather = Weather.objects.create(
         flight=flight,
-        description=description,
-        weather=weather_info,
-        day=day,
-        rain=rain,
-        wind=wind,
+        desc=desc,
+        longDesc=long_desc,
+        temperature=basic_weather['temp'],
+        pressure=basic_weather['pressure'],
+        humidity=basic_weather['humidity'],
+        tempMin=basic_weather['temp_min'],
+        tempMax=basic_weather['temp_max'],
+        pressureSea=basic_weather.get('sea_level'),
+        pressureGround=basic_weather.get('grnd_level'),
+        clouds=clouds,
+        sunrise=sunrise,
+        sunset=sunset,
+        has_rain=has_rain,
+        rain1=rain_raw.get('1h'),
+        rain3=rain_raw.get('3h'),
+        has_wind=has_wind,
+        windSpeed=wind_info_raw.get("speed", 0),
+        windDegree=wind_info_raw.get("deg", 0),
         timeFetched=time_fetched
     )
 
     return weather
 
-def get_weather_for_flight(flight):
+# Flights older than this get no weather by default, since the free
+# OpenWeatherMap plan only has the weather of the last five days.
+MAX_WEATHER_AGE = timezone.timedelta(days=5)
+
+def get_flight_location(flight, current_time):
+    """
+    Return the rounded location used to fetch the weather of a flight, and
+    whether historical weather is needed.
+    """
+    lat = round(flight.latitude, 3)
+    lon = round(flight.longitude, 3)
+    old = (current_time - flight.dateOfFlight > timezone.timedelta(minutes=30))
+    return lat, lon, old
+
+def get_weather_for_flight(flight, max_age=MAX_WEATHER_AGE):
+    """
+    Fetch and save the weather at the time of the flight. Returns `None`,
+    without fetching anything, if the flight is older than `max_age` (which
+    can be `None` to fetch the weather of any flight).
+    """
     date_of_flight = flight.dateOfFlight
     current_time = timezone.now()
 
     # print("Got times")
 
 
-    if (current_time - date_of_flight) > timezone.timedelta(days=5):
+    if max_age is not None and (current_time - date_of_flight) > max_age:
         return None
 
-    lat = round(flight.latitude, 3)
-    lon = round(flight.longitude, 3)
+    lat, lon, old = get_flight_location(flight, current_time)
     # print("Got location")
 
-    old = (current_time-date_of_flight > timezone.timedelta(minutes=30))
-
     # rawDate = (dateOfFlight - dateOfFlight.utcoffset()).replace(tzinfo=None)
 
     weather_data = get_weather_for_location(lat, lon, old=old, time=date_of_flight)
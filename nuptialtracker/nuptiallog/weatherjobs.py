@@ -0,0 +1,151 @@
+#
+#  weatherjobs.py
+# AntNupTracker Server, backend for recording and managing ant nuptial flight data
+# Copyright (C) 2026  Abouheif Lab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Queue of weather fetches.
+
+New flights get a `WeatherJob` row instead of a thread fetching their
+weather. The jobs are run by the `weatherworker` management command with a
+bounded number of threads. Failed fetches are retried with exponential
+backoff, up to `MAX_ATTEMPTS` times. Since the jobs are stored in the
+database, they survive restarts, and jobs left running by a worker that died
+are picked up again after `STALE_AFTER`.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Weather, WeatherJob
+from .weather import get_weather_for_flight
+
+MAX_ATTEMPTS = 5
+
+# Delay before the first retry, doubled after each failed attempt.
+RETRY_DELAY = timezone.timedelta(minutes=1)
+MAX_RETRY_DELAY = timezone.timedelta(hours=1)
+
+# Running jobs not updated for this long are assumed to be abandoned.
+STALE_AFTER = timezone.timedelta(minutes=10)
+
+def enqueue(flight):
+    """
+    Queue a weather fetch for the flight, unless one is already queued. Failed
+    jobs are queued again.
+    """
+    job, created = WeatherJob.objects.get_or_create(flight=flight)
+
+    if not created and job.status == WeatherJob.FAILED:
+        WeatherJob.objects.filter(pk=job.pk).update(
+            status=WeatherJob.PENDING, attempts=0, run_after=timezone.now(), last_error=""
+        )
+
+    return job
+
+def get_retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+def requeue_stale():
+    """
+    Queue the jobs again whose worker seems to have stopped.
+    """
+    return WeatherJob.objects.filter(
+        status=WeatherJob.RUNNING, updated__lt=timezone.now() - STALE_AFTER
+    ).update(status=WeatherJob.PENDING, updated=timezone.now())
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` jobs that are due as running and return their IDs.
+    Jobs locked by other workers are skipped.
+    """
+    jobs = WeatherJob.objects.filter(status=WeatherJob.PENDING, run_after__lte=timezone.now()).order_by("run_after")
+
+    if connection.features.has_select_for_update_skip_locked:
+        jobs = jobs.select_for_update(skip_locked=True)
+
+    with transaction.atomic():
+        job_ids = list(jobs.values_list("pk", flat=True)[:limit])
+        WeatherJob.objects.filter(pk__in=job_ids).update(
+            status=WeatherJob.RUNNING, attempts=F("attempts") + 1, updated=timezone.now()
+        )
+
+    return job_ids
+
+def finish(job, status, error=""):
+    WeatherJob.objects.filter(pk=job.pk).update(status=status, last_error=error, updated=timezone.now())
+
+def run_job(job_id):
+    """
+    Fetch the weather for a claimed job. Returns the new status of the job.
+    """
+    job = WeatherJob.objects.select_related("flight").get(pk=job_id)
+
+    if Weather.objects.filter(flight_id=job.flight_id).exists():
+        finish(job, WeatherJob.DONE)
+        return WeatherJob.DONE
+
+    try:
+        # Leave no partial weather behind if the response cannot be parsed
+        with transaction.atomic():
+            weather = get_weather_for_flight(job.flight)
+    except Exception as error:
+        message = f"{type(error).__name__}: {error}"
+
+        if job.attempts >= MAX_ATTEMPTS:
+            finish(job, WeatherJob.FAILED, message)
+            return WeatherJob.FAILED
+
+        WeatherJob.objects.filter(pk=job.pk).update(
+            status=WeatherJob.PENDING,
+            last_error=message,
+            run_after=timezone.now() + get_retry_delay(job.attempts),
+            updated=timezone.now(),
+        )
+        return WeatherJob.PENDING
+
+    if weather is None:
+        finish(job, WeatherJob.SKIPPED, "No weather available for the time of the flight")
+        return WeatherJob.SKIPPED
+
+    finish(job, WeatherJob.DONE)
+    return WeatherJob.DONE
+
+def run_job_in_thread(job_id):
+    # Each thread has its own database connection, which must be closed
+    # once the job is done.
+    try:
+        return run_job(job_id)
+    finally:
+        connection.close()
+
+def run_pending(max_workers, limit=None):
+    """
+    Run the jobs that are due, at most `max_workers` at a time, and return the
+    new status of each job that was run. With a single worker, the jobs are
+    run in the calling thread.
+    """
+    job_ids = claim_jobs(limit or max_workers * 10)
+
+    if max_workers <= 1:
+        return [run_job(job_id) for job_id in job_ids]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run_job_in_thread, job_ids))
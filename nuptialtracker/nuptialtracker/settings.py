@@ -136,6 +136,56 @@ DATABASES = {
     }
 }
 
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# The flights cache holds rendered flight payloads. Local memory is private to
+# each worker process: use a FileBasedCache to share it between the workers of
+# one machine, or a shared cache server (Redis, Memcached) where one exists.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'flights': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'flights',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Weather responses, shared by flights close in space and time. The
+    # local memory cache evicts the least recently used entries when full.
+    'weather': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'weather',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# Weather fetches
+# "openweathermap" uses the OpenWeatherMap API (WEATHERKEY must be set), while
+# "local" makes up weather locally, for development and tests.
+
+WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "openweathermap")
+
+# Number of weather fetches run at once by the weatherworker command
+WEATHER_WORKERS = 4
+
+# Size of the cells, in degrees, within which flights in the same hour share
+# the same weather response
+WEATHER_CACHE_GRID = 0.05
+
+# Export snapshots
+# Rows cached between snapshot refreshes. Keep them out of MEDIA_ROOT, which
+# may be served publicly.
+
+SNAPSHOT_CACHE_DIR = os.path.join(BASE_DIR, 'snapshot_cache')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators